@@ -0,0 +1,565 @@
+"""Storage and operation-size benchmarks for example_contract.py.
+
+Every ShareIssuer, ShareWallet and Governance entrypoint is called once on
+contracts pre-populated with an increasing number of holders, each call in a
+level of its own. Each call is measured from the scenario log and written to
+benchmark_report.json:
+
+    param_bytes    size of the parameter of the call
+    storage_bytes  paid storage of the called contract after the call
+    storage_delta  paid storage added to every contract the call touched or
+                   originated
+    operations     internal operations emitted by the call and its callees
+    gas            gas consumed by the call and its callees, in mockup mode only
+
+Sizes are binary Micheline. Paid storage is counted the way the protocol
+charges it: the storage in its optimized form with every big_map replaced by
+its id, plus 33 bytes per big_map and 65 bytes plus the value for each
+big_map entry.
+
+distribute_shares_bulk distributes to BULK_DESTINATIONS wallets in one call
+and claim_shares_direct_each claims for as many other wallets, one
+claim_shares_direct call each, every call in a level of its own. The
+metrics of these two rows are totals over their calls.
+
+update_share_ledger_batch and receive_shares are only called by other
+contracts, with tickets they cannot be given from a scenario. They are
+measured as the first execution of each inside transfer_shares_batch, and
+have no param_bytes.
+
+Gas is read from the octez-client receipts in the log, which only mockup
+mode writes (SMARTPY_FLAGS="--mode mockup", with octez-client installed).
+The native interpreter reports no gas, so its reports leave gas empty, and
+gas is only compared when both the baseline and the report have it. The
+internal calls above get no gas of their own: the receipt is printed for the
+whole operation, and counted for transfer_shares_batch.
+
+The report also lists the origination cost of each contract:
+
+    code_bytes     size of the contract code, including its views
+    storage_bytes  paid size of the initial storage
+    burn_mutez     storage burn paid by the originator
+
+Run from this directory:
+
+    python example_contract_benchmark.py                    # compare with the baseline
+    python example_contract_benchmark.py --update-baseline  # record a new baseline
+
+BENCH_HOLDER_COUNTS (e.g. "10,100") limits the holder counts and
+BENCH_TOLERANCE (default 0.02) sets the allowed relative regression.
+"""
+
+import itertools
+import json
+import os
+import pathlib
+import re
+import sys
+
+import smartpy as sp
+
+from example_contract import main
+
+HOLDER_COUNTS = [10, 100, 1000, 5000]
+BASELINE_FILE = pathlib.Path(__file__).with_name("example_contract_benchmark_baseline.json")
+REPORT_FILE = pathlib.Path("benchmark_report.json")
+COMPARED_METRICS = ["param_bytes", "storage_delta", "operations", "gas"]
+COMPARED_ORIGINATION_METRICS = ["code_bytes", "storage_bytes"]
+# Originated in this order, so the n-th contract of the scenario is ORIGINATED[n]
+ORIGINATED = ["TSWalletContract", "ShareIssuer", "ShareWallet", "Governance"]
+# Protocol constants: burn per byte of storage, and bytes charged per new contract
+COST_PER_BYTE_MUTEZ = 250
+ORIGINATION_SIZE = 257
+# Protocol constants: bytes charged per new big_map, and per new big_map entry on top of its value
+BIG_MAP_SIZE = 33
+BIG_MAP_ENTRY_SIZE = 65
+# Bytes of an address in the optimized encoding
+ADDRESS_SIZE = 22
+REGISTRY_NUMBER = 123456
+# Entries processed by the benchmarked continue_maintenance call
+MAINTENANCE_CHUNK = 100
+# Wallets served by the benchmarked bulk distribution, and by as many individual claims
+BULK_DESTINATIONS = 20
+BULK_SHARES = 10
+BENCH_TAG = "bench: "
+# Entrypoints measured inside the operation of another benchmarked entrypoint
+INTERNAL_CALLS = {"transfer_shares_batch": ["update_share_ledger_batch", "receive_shares"]}
+ORIGINATION_SCENARIO = "ExampleContractOrigination"
+
+
+def scenario_name(holder_count):
+    return "ExampleContractBenchmark_%d" % holder_count
+
+
+def scenario_output(name):
+    """Directory the scenario name writes its log and compiled contracts to."""
+    return pathlib.Path(os.environ.get("SMARTPY_OUTPUT_DIR", "."), name)
+
+
+def read_log(output_dir):
+    """Lines of the scenario log in output_dir, so far."""
+    if not output_dir.is_dir():
+        raise FileNotFoundError("No scenario output in %s: check SMARTPY_OUTPUT_DIR and the scenario name" % output_dir)
+    path = output_dir / "log.txt"
+    if not path.is_file():
+        raise FileNotFoundError("No scenario log %s: the scenario has not written its log there" % path)
+    return path.read_text().splitlines()
+
+
+def run_benchmark(holder_count):
+    scenario = sp.test_scenario(scenario_name(holder_count), main)
+    if scenario.simulation_mode() is not sp.SimulationMode.MOCKUP:
+        scenario.p("Native mode: gas is not measured")
+
+    admin = sp.test_account("Admin1")
+    wallet_admin = sp.test_account("WalletAdmin")
+    holders = [sp.test_account("Holder%d" % i).address for i in range(holder_count)]
+
+    levels = itertools.count(1)
+
+    def bench(entrypoint):
+        """Starts measuring entrypoint and returns the level of its call."""
+        scenario.h3(BENCH_TAG + entrypoint)
+        return next(levels)
+
+    scenario.h1("Benchmark with %d holders" % holder_count)
+    # The issuer starts with every holder both allocated and in the ledger
+    issuer = main.ShareIssuer(admin.address)
+    issuer.data.registry_number = sp.Some(REGISTRY_NUMBER)
+    issuer.data.max_shares = sp.Some(20 * holder_count + 10000)
+    issuer.data.issued_shares = 10 * holder_count
+    issuer.data.allocated_shares = 10 * holder_count
+    issuer.data.owners_map = sp.big_map({holder: 5 for holder in holders})
+    issuer.data.owners = sp.big_map({i: holder for i, holder in enumerate(holders)})
+    issuer.data.owner_positions = sp.big_map({holder: i for i, holder in enumerate(holders)})
+    issuer.data.owner_count = holder_count
+    issuer.data.active_share_ledger = sp.big_map({holder: 5 for holder in holders})
+    issuer.data.holders = sp.big_map({i: holder for i, holder in enumerate(holders)})
+    issuer.data.holder_positions = sp.big_map({holder: i for i, holder in enumerate(holders)})
+    issuer.data.holder_count = holder_count
+    issuer.data.ledger_supply = 5 * holder_count
+    scenario += issuer
+
+    wallets = []
+    for i in range(4):
+        wallet = main.ShareWallet(wallet_admin.address)
+        scenario += wallet
+        wallets.append(wallet)
+
+    governance = main.Governance(governanceAdmin=admin.address)
+    governance.data.deployedContracts = sp.big_map({i: issuer.address for i in range(holder_count)})
+    scenario += governance
+
+    level = bench("issue_shares_unclaimed2")
+    issuer.issue_shares_unclaimed2(shares_amount=1000, _level=level)
+    level = bench("add_company_data")
+    issuer.add_company_data(registry_number=REGISTRY_NUMBER, max_shares=20 * holder_count + 10000, issued_shares=0, all_shares_issued=False, _sender=admin.address, _level=level)
+    level = bench("change_max_shares")
+    issuer.change_max_shares(new_max_shares=20 * holder_count + 10000, _sender=admin.address, _level=level)
+    level = bench("change_admin")
+    issuer.change_admin(admin.address, _sender=admin.address, _level=level)
+    level = bench("add_share_owner")
+    issuer.add_share_owner(owner_address=wallets[0].address, amount=100, _sender=admin.address, _level=level)
+    level = bench("add_share_owners")
+    issuer.add_share_owners([
+        sp.record(owner_address=wallets[1].address, amount=100),
+        sp.record(owner_address=wallets[2].address, amount=100),
+        sp.record(owner_address=wallets[3].address, amount=100),
+        sp.record(owner_address=holders[0], amount=10),
+    ], _sender=admin.address, _level=level)
+    level = bench("remove_share_owner")
+    issuer.remove_share_owner(owner_address=holders[1], _sender=admin.address, _level=level)
+    level = bench("remove_share_owners")
+    issuer.remove_share_owners([holders[2], holders[3]], _sender=admin.address, _level=level)
+    level = bench("migrate_share_owners")
+    issuer.migrate_share_owners([sp.record(owner_address=holders[4], amount=5)], _sender=admin.address, _level=level)
+
+    level = bench("process_share_claim")
+    issuer.process_share_claim(_sender=wallets[0].address, _level=level)
+    level = bench("claim_shares")
+    wallets[1].claim_shares(issuer.address, _sender=wallet_admin.address, _level=level)
+    level = bench("claim_shares_direct")
+    issuer.claim_shares_direct(destination_address=wallets[2].address, _level=level)
+    level = bench("distribute_shares")
+    issuer.distribute_shares([wallets[3].address], _sender=admin.address, _level=level)
+
+    # The claims above split the unclaimed ticket; the ones below mint from unclaimed_shares
+    scenario.h3(BENCH_TAG + "end")
+    issuer.add_share_owners([sp.record(owner_address=wallet.address, amount=100) for wallet in wallets], _sender=admin.address)
+    level = bench("issue_shares_lazy")
+    issuer.issue_shares_lazy(shares_amount=1000, _sender=admin.address, _level=level)
+    level = bench("process_share_claim_lazy")
+    issuer.process_share_claim(_sender=wallets[0].address, _level=level)
+    level = bench("claim_shares_lazy")
+    wallets[1].claim_shares(issuer.address, _sender=wallet_admin.address, _level=level)
+    level = bench("claim_shares_direct_lazy")
+    issuer.claim_shares_direct(destination_address=wallets[2].address, _level=level)
+    level = bench("distribute_shares_lazy")
+    issuer.distribute_shares([wallets[3].address], _sender=admin.address, _level=level)
+
+    scenario.h3(BENCH_TAG + "end")
+    bulk_wallets = []
+    for i in range(2 * BULK_DESTINATIONS):
+        wallet = main.ShareWallet(wallet_admin.address)
+        scenario += wallet
+        bulk_wallets.append(wallet)
+    issuer.issue_shares_lazy(shares_amount=len(bulk_wallets) * BULK_SHARES, _sender=admin.address)
+    issuer.add_share_owners([sp.record(owner_address=wallet.address, amount=BULK_SHARES) for wallet in bulk_wallets], _sender=admin.address)
+    level = bench("distribute_shares_bulk")
+    issuer.distribute_shares([wallet.address for wallet in bulk_wallets[:BULK_DESTINATIONS]], _sender=admin.address, _level=level)
+    level = bench("claim_shares_direct_each")
+    for wallet in bulk_wallets[BULK_DESTINATIONS:]:
+        issuer.claim_shares_direct(destination_address=wallet.address, _level=level)
+        level = next(levels)
+
+    level = bench("update_share_ledger")
+    issuer.update_share_ledger(from_address=holders[5], to_address=holders[6], amount=1, _sender=holders[5], _level=level)
+    level = bench("transfer_shares_batch")
+    wallets[0].transfer_shares_batch(share=issuer.address, transfers=[
+        sp.record(to_address=wallets[1].address, amount=10),
+        sp.record(to_address=wallets[2].address, amount=10),
+    ], _sender=wallet_admin.address, _level=level)
+    # TSWalletContract.transfer_shares is not benchmarked: it sends to
+    # receive_claimed_shares, which no contract implements.
+
+    level = bench("start_maintenance")
+    issuer.start_maintenance(sp.variant.recompute_allocations(()), _sender=admin.address, _level=level)
+    level = bench("continue_maintenance")
+    issuer.continue_maintenance(MAINTENANCE_CHUNK, _sender=admin.address, _level=level)
+
+    level = bench("create_company")
+    governance.create_company(companyID=holder_count + 1, shares=1000, admin=admin.address, _sender=admin.address, _level=level)
+    level = bench("create_companies")
+    governance.create_companies([
+        sp.record(companyID=holder_count + 3, shares=1000, admin=admin.address),
+        sp.record(companyID=holder_count + 4, shares=1000, admin=wallet_admin.address),
+    ], _sender=admin.address, _level=level)
+    level = bench("register_company")
+    governance.register_company(companyID=holder_count + 2, company_address=issuer.address, admin=admin.address, _sender=admin.address, _level=level)
+    scenario.h3(BENCH_TAG + "end")
+
+
+def run_origination_benchmark():
+    scenario = sp.test_scenario(ORIGINATION_SCENARIO, main)
+    admin = sp.test_account("Admin1")
+
+    scenario.h1("Origination of each contract")
+    scenario += main.TSWalletContract(admin.address)
+    scenario += main.ShareIssuer(admin.address)
+    scenario += main.ShareWallet(admin.address)
+    scenario += main.Governance(governanceAdmin=admin.address)
+
+
+MICHELSON_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|0x[0-9a-fA-F]*|-?\d+|\w+|[(){};]')
+
+
+def parse_michelson(text):
+    """Parses a Michelson value, as printed in the scenario log, into Micheline JSON."""
+    tokens = MICHELSON_TOKEN.findall(text)
+    position = 0
+
+    def expression(with_args):
+        nonlocal position
+        token = tokens[position]
+        position += 1
+        if token == "(":
+            node = expression(True)
+            position += 1
+            return node
+        if token == "{":
+            items = []
+            while tokens[position] != "}":
+                items.append(expression(True))
+                if tokens[position] == ";":
+                    position += 1
+            position += 1
+            return items
+        if token.startswith('"'):
+            return {"string": json.loads(token)}
+        if token.startswith("0x"):
+            return {"bytes": token[2:]}
+        if token[0] == "-" or token.isdigit():
+            return {"int": token}
+        args = []
+        while with_args and position < len(tokens) and tokens[position] not in (")", ";", "}"):
+            args.append(expression(False))
+        return {"prim": token, "args": args} if args else {"prim": token}
+
+    return expression(True)
+
+
+def micheline_size(node):
+    """Size of a Micheline JSON expression in the binary encoding used on chain."""
+    if isinstance(node, list):
+        return 5 + sum(micheline_size(item) for item in node)
+    if "int" in node:
+        bits = abs(int(node["int"])).bit_length()
+        return 2 if bits <= 6 else 2 + -(-(bits - 6) // 7)
+    if "string" in node:
+        return 5 + len(node["string"].encode())
+    if "bytes" in node:
+        return 5 + len(node["bytes"]) // 2
+    args = node.get("args", [])
+    annots = " ".join(node.get("annots", []))
+    size = 2 + sum(micheline_size(arg) for arg in args)
+    if len(args) > 2:
+        return size + 8 + len(annots.encode())
+    return size + (4 + len(annots.encode()) if annots else 0)
+
+
+def storage_type(contract):
+    """The storage type of a contract given as Micheline JSON."""
+    return next(section for section in contract if section.get("prim") == "storage")["args"][0]
+
+
+def comb_right(args):
+    """The right side of a pair type with the given arguments, as a nested pair when it is n-ary."""
+    return args[1] if len(args) == 2 else {"prim": "pair", "args": args[1:]}
+
+
+def optimized(value, type_):
+    """Returns value in the optimized form the protocol stores, with every
+    big_map replaced by its id, and the bytes paid for the big_maps' contents."""
+    prim = type_["prim"]
+    args = type_.get("args", [])
+    if prim == "ticket":
+        prim, args = "pair", [{"prim": "address"}, {"prim": "pair", "args": [args[0], {"prim": "nat"}]}]
+    if prim == "pair":
+        left_type, right_type = args[0], comb_right(args)
+        items = value if isinstance(value, list) else value["args"]
+        right_value = items[1] if len(items) == 2 else {"prim": "Pair", "args": items[1:]}
+        left, left_lazy = optimized(items[0], left_type)
+        right, right_lazy = optimized(right_value, right_type)
+        lazy = left_lazy + right_lazy
+        # Right combs of four or more elements are stored as sequences
+        if right_type["prim"] == "pair":
+            if isinstance(right, list):
+                return [left] + right, lazy
+            if comb_right(right_type["args"])["prim"] == "pair":
+                return [left, right["args"][0]] + right["args"][1]["args"], lazy
+        return {"prim": "Pair", "args": [left, right]}, lazy
+    if prim == "option" and value["prim"] == "Some":
+        some, lazy = optimized(value["args"][0], args[0])
+        return {"prim": "Some", "args": [some]}, lazy
+    if prim == "or":
+        side, lazy = optimized(value["args"][0], args[0 if value["prim"] == "Left" else 1])
+        return {"prim": value["prim"], "args": [side]}, lazy
+    if prim in ("list", "set"):
+        items = [optimized(item, args[0]) for item in value]
+        return [item for item, _ in items], sum(lazy for _, lazy in items)
+    if prim == "map":
+        entries = [(optimized(entry["args"][0], args[0]), optimized(entry["args"][1], args[1])) for entry in value]
+        return [{"prim": "Elt", "args": [key, item]} for (key, _), (item, _) in entries], 0
+    if prim == "big_map":
+        lazy = BIG_MAP_SIZE
+        for entry in value:
+            lazy += BIG_MAP_ENTRY_SIZE + micheline_size(optimized(entry["args"][1], args[1])[0])
+        return {"int": "0"}, lazy
+    if prim in ("address", "contract") and "string" in value:
+        address, _, entrypoint = value["string"].partition("%")
+        return {"bytes": "00" * ADDRESS_SIZE + entrypoint.encode().hex()}, 0
+    return value, 0
+
+
+def paid_size(value, type_):
+    """Storage bytes paid for value, big_map contents included."""
+    node, lazy = optimized(value, type_)
+    return micheline_size(node) + lazy
+
+
+def parse_origination(output_dir):
+    """Measures the code and initial storage of every originated contract."""
+    results = {}
+    for path in sorted(output_dir.glob("*_cont_*_contract.json")):
+        index = int(re.search(r"_cont_(\d+)_", path.name).group(1))
+        contract = json.loads(path.read_text())
+        code_bytes = micheline_size(contract)
+        storage_path = path.with_name(path.name.replace("_contract.json", "_storage.json"))
+        storage_bytes = paid_size(json.loads(storage_path.read_text()), storage_type(contract))
+        results[ORIGINATED[index]] = {
+            "code_bytes": code_bytes,
+            "storage_bytes": storage_bytes,
+            "burn_mutez": (code_bytes + storage_bytes + ORIGINATION_SIZE) * COST_PER_BYTE_MUTEZ,
+        }
+    return results
+
+
+def new_metrics():
+    return {
+        "param_bytes": None,
+        "storage_bytes": None,
+        "storage_delta": 0,
+        "operations": 0,
+        "gas": None,
+    }
+
+
+def parse_log(output_dir):
+    """Splits the scenario log into benchmarked calls and measures each of them.
+
+    Like the protocol, the interpreter runs the operations emitted by a call
+    depth-first: they run before the ones still pending from its callers.
+    """
+    results = {}
+    addresses = {}
+    storage_types = {}
+    storages = {}
+    pending_origination = None
+    pending_targets = []
+    emitted_targets = []
+    next_target = None
+    entrypoint = None
+    measured = []
+    current_target = None
+
+    for line in read_log(output_dir):
+        if line.startswith(" h3: " + BENCH_TAG):
+            entrypoint = line[len(" h3: " + BENCH_TAG):]
+            measured = [] if entrypoint == "end" else [results.setdefault(entrypoint, new_metrics())]
+            continue
+
+        match = re.match(r"Creating contract (KT1\w+)", line)
+        if match:
+            pending_origination = [match.group(1), None]
+            continue
+        match = re.match(r"file (.*_cont_(\d+)_contract\.json)", line)
+        if match and pending_origination is not None:
+            address, storage = pending_origination
+            addresses[match.group(2)] = address
+            storage_types[address] = storage_type(json.loads(pathlib.Path(match.group(1)).read_text()))
+            storages[address] = paid_size(parse_michelson(storage), storage_types[address])
+            for metrics in measured:
+                metrics["storage_delta"] += storages[address]
+            pending_origination = None
+            continue
+        match = re.match(r"file (.*_cont_(\d+)_params\.json)", line)
+        if match:
+            next_target = addresses[match.group(2)]
+            if measured:
+                measured[0]["param_bytes"] = (measured[0]["param_bytes"] or 0) + micheline_size(json.loads(pathlib.Path(match.group(1)).read_text()))
+            continue
+        match = re.match(r"\s+to:\s+sp\.contract\(.*sp\.address\('(KT1\w+)%", line)
+        if match:
+            emitted_targets.append(match.group(1))
+            continue
+        match = re.match(r"\s*Consumed gas: ([\d.]+)", line)
+        if match:
+            if measured:
+                measured[0]["gas"] = (measured[0]["gas"] or 0) + float(match.group(1))
+            continue
+        if re.match(r"\s+\+ (Transfer|Create Contract)", line):
+            for metrics in measured:
+                metrics["operations"] += 1
+            continue
+        match = re.match(r"Executing (\w+)\(", line)
+        if match:
+            pending_targets[:0] = emitted_targets
+            emitted_targets = []
+            current_target = next_target if next_target is not None else pending_targets.pop(0)
+            next_target = None
+            measured = measured[:1]
+            if measured and match.group(1) in INTERNAL_CALLS.get(entrypoint, []) and match.group(1) not in results:
+                measured.append(results.setdefault(match.group(1), new_metrics()))
+            continue
+        if line.startswith(" -> "):
+            if pending_origination is not None and pending_origination[1] is None:
+                pending_origination[1] = line[len(" -> "):]
+                continue
+            if current_target is None:
+                continue
+            storage = paid_size(parse_michelson(line[len(" -> "):]), storage_types[current_target])
+            for metrics in measured:
+                if metrics["storage_bytes"] is None:
+                    metrics["storage_bytes"] = storage
+                metrics["storage_delta"] += storage - storages[current_target]
+            storages[current_target] = storage
+            current_target = None
+
+    return results
+
+
+def find_regressions(report, baseline, tolerance):
+    regressions = []
+    # Metrics missing on either side, like gas outside mockup mode, are not compared
+    for holder_count, entrypoints in baseline["results"].items():
+        for entrypoint, metrics in entrypoints.items():
+            current = report["results"].get(holder_count, {}).get(entrypoint)
+            if current is None:
+                regressions.append("%s at %s holders: not measured" % (entrypoint, holder_count))
+                continue
+            for metric in COMPARED_METRICS:
+                expected = metrics.get(metric)
+                actual = current.get(metric)
+                if expected is None or actual is None:
+                    continue
+                if actual > expected + abs(expected) * tolerance:
+                    regressions.append("%s at %s holders: %s %d > baseline %d" % (entrypoint, holder_count, metric, actual, expected))
+    for contract, metrics in baseline.get("origination", {}).items():
+        current = report["origination"].get(contract)
+        if current is None:
+            regressions.append("%s origination: not measured" % contract)
+            continue
+        for metric in COMPARED_ORIGINATION_METRICS:
+            if current[metric] > metrics[metric] + metrics[metric] * tolerance:
+                regressions.append("%s origination: %s %d > baseline %d" % (contract, metric, current[metric], metrics[metric]))
+    return regressions
+
+
+if "main" in __name__:
+    holder_counts = HOLDER_COUNTS
+    if os.environ.get("BENCH_HOLDER_COUNTS"):
+        holder_counts = [int(count) for count in os.environ["BENCH_HOLDER_COUNTS"].split(",")]
+    tolerance = float(os.environ.get("BENCH_TOLERANCE", "0.02"))
+
+    for holder_count in holder_counts:
+        @sp.add_test()
+        def benchmark():
+            run_benchmark(holder_count)
+
+    @sp.add_test()
+    def origination_benchmark():
+        run_origination_benchmark()
+
+    report = {
+        "holder_counts": holder_counts,
+        "results": {
+            str(holder_count): parse_log(scenario_output(scenario_name(holder_count)))
+            for holder_count in holder_counts
+        },
+        "origination": parse_origination(scenario_output(ORIGINATION_SCENARIO)),
+    }
+    REPORT_FILE.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+    print("Benchmark report written to %s" % REPORT_FILE)
+
+    # Before the split every company and every holder wallet was a TSWalletContract
+    origination = report["origination"]
+    for role, before, after in [("company", "TSWalletContract", "ShareIssuer"), ("holder wallet", "TSWalletContract", "ShareWallet")]:
+        print("%s origination: %d -> %d bytes, %d -> %d mutez burned" % (
+            role,
+            origination[before]["code_bytes"] + origination[before]["storage_bytes"],
+            origination[after]["code_bytes"] + origination[after]["storage_bytes"],
+            origination[before]["burn_mutez"],
+            origination[after]["burn_mutez"],
+        ))
+
+    for holder_count, results in report["results"].items():
+        bulk, each = results["distribute_shares_bulk"], results["claim_shares_direct_each"]
+        print("%d destinations at %s holders: distribute_shares %d param bytes, %d storage bytes, %d operations;"
+              " claim_shares_direct each %d param bytes, %d storage bytes, %d operations" % (
+                  BULK_DESTINATIONS, holder_count,
+                  bulk["param_bytes"], bulk["storage_delta"], bulk["operations"],
+                  each["param_bytes"], each["storage_delta"], each["operations"],
+              ))
+
+    if "--update-baseline" in sys.argv:
+        BASELINE_FILE.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+        print("Baseline updated: %s" % BASELINE_FILE)
+    elif BASELINE_FILE.exists():
+        baseline = json.loads(BASELINE_FILE.read_text())
+        baseline["results"] = {count: baseline["results"][count] for count in map(str, holder_counts) if count in baseline["results"]}
+        regressions = find_regressions(report, baseline, tolerance)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No regressions against %s" % BASELINE_FILE)
@@ -0,0 +1,349 @@
+"""Differential and invariant fuzzing of example_contract.py.
+
+Random operation sequences run on the pure-Python model in
+example_contract_model.py, which is checked against the ledger invariants
+after every operation. A sample of the sequences is then replayed through
+sp.test_scenario: every call must succeed or fail as it did in the model,
+and the storage of every contract must end up identical to the model's.
+
+Run from this directory:
+
+    python example_contract_differential.py
+
+FUZZ_SEED (default 0) picks the sequences. FUZZ_SEQUENCES (default 25000)
+sequences of FUZZ_STEPS (default 40) operations, a million in all, run on
+the model, and the first FUZZ_REPLAYS (default 10) of them are replayed in
+SmartPy. Only the replayed sequences are kept in memory.
+
+receive_shares and update_share_ledger_batch are only reached through
+other entrypoints: calling them directly needs forged tickets, which would
+break the ticket supply invariant. Shares are only allocated and
+transferred to wallet contracts: the SmartPy interpreter accepts
+sp.contract on implicit accounts, which the chain and the model reject.
+"""
+
+import os
+import random
+import sys
+import time
+
+import smartpy as sp
+
+from example_contract import main
+import example_contract_model as model
+
+ACCOUNTS = ["Admin", "User0", "User1"]
+ADMIN = "Admin"
+ISSUERS = ["issuer", "legacy"]
+WALLETS = ["wallet0", "wallet1", "legacy"]
+REGISTRY_NUMBERS = {"issuer": 111, "legacy": 222}
+AMOUNTS = [1, 5, 10, 50, 100, 400]
+COMPANY_IDS = [1, 2, 3]
+MAINTENANCE_TASKS = ["clear_share_owners", "recompute_allocations"]
+
+
+def new_chain():
+    chain = model.Chain()
+    chain.originate(model.ShareIssuer(ADMIN), "issuer")
+    chain.originate(model.TSWalletContract(ADMIN), "legacy")
+    chain.originate(model.ShareWallet("User0"), "wallet0")
+    chain.originate(model.ShareWallet("User1"), "wallet1")
+    chain.originate(model.Governance(ADMIN), "governance")
+    return chain
+
+
+def setup_steps():
+    return [
+        (ADMIN, issuer, "add_company_data", {
+            "registry_number": REGISTRY_NUMBERS[issuer],
+            "max_shares": 1000,
+            "issued_shares": 0,
+            "all_shares_issued": False,
+        }, 0)
+        for issuer in ISSUERS
+    ]
+
+
+def random_step(rng, chain, level):
+    """Returns (sender, address, entrypoint, params, level) for a random operation."""
+    issuers = ISSUERS + [address for address in chain.contracts if address.startswith("created")]
+    issuer = rng.choice(issuers)
+    holders = WALLETS + ACCOUNTS[1:]
+    admin = rng.choice([chain.contracts[issuer].admin_address] * 4 + ACCOUNTS)
+
+    def amount():
+        return rng.choice(AMOUNTS)
+
+    def allocations():
+        return [{"owner_address": rng.choice(WALLETS), "amount": amount()} for i in range(rng.randint(1, 3))]
+
+    kind = rng.choice([
+        "issue_shares_unclaimed2", "issue_shares_lazy", "add_share_owner", "add_share_owner",
+        "add_share_owners", "remove_share_owner", "remove_share_owners", "migrate_share_owners",
+        "process_share_claim", "claim_shares", "claim_shares", "claim_shares_direct", "distribute_shares",
+        "update_share_ledger", "update_share_ledger", "transfer_shares_batch", "transfer_shares_batch",
+        "transfer_shares", "change_max_shares", "add_company_data", "change_admin",
+        "create_company", "create_companies", "register_company",
+        "start_maintenance", "continue_maintenance", "continue_maintenance",
+    ])
+    if kind in ("issue_shares_unclaimed2", "issue_shares_lazy"):
+        return (admin, issuer, kind, {"shares_amount": amount()}, level)
+    if kind == "add_share_owner":
+        return (admin, issuer, kind, allocations()[0], level)
+    if kind in ("add_share_owners", "migrate_share_owners"):
+        return (admin, issuer, kind, allocations(), level)
+    if kind == "remove_share_owner":
+        return (admin, issuer, kind, {"owner_address": rng.choice(holders)}, level)
+    if kind == "remove_share_owners":
+        return (admin, issuer, kind, rng.sample(holders, rng.randint(1, 2)), level)
+    if kind == "process_share_claim":
+        return (rng.choice(holders), issuer, kind, None, level)
+    if kind == "claim_shares":
+        return (rng.choice(ACCOUNTS), rng.choice(WALLETS), kind, issuer, level)
+    if kind == "claim_shares_direct":
+        return (rng.choice(ACCOUNTS), issuer, kind, {"destination_address": rng.choice(holders)}, level)
+    if kind == "distribute_shares":
+        return (admin, issuer, kind, rng.sample(holders, rng.randint(1, 2)), level)
+    if kind == "update_share_ledger":
+        owner = rng.choice(holders)
+        return (owner, issuer, kind, {"from_address": owner, "to_address": rng.choice(holders), "amount": amount()}, level)
+    if kind == "transfer_shares_batch":
+        wallet = rng.choice(WALLETS)
+        transfers = [{"to_address": rng.choice(WALLETS), "amount": rng.choice(AMOUNTS[:4])} for i in range(rng.randint(1, 3))]
+        sender = rng.choice([chain.contracts[wallet].admin_address] * 4 + ACCOUNTS)
+        return (sender, wallet, kind, {"share": issuer, "transfers": transfers}, level)
+    if kind == "transfer_shares":
+        return (ADMIN, "legacy", kind, {"share": issuer, "amount": amount(), "destination": rng.choice(WALLETS)}, level)
+    if kind == "change_max_shares":
+        return (admin, issuer, kind, {"new_max_shares": rng.choice([500, 1000, 2000])}, level)
+    if kind == "add_company_data":
+        registry_number = rng.choice([chain.contracts[issuer].registry_number or 0] * 3 + [999])
+        return (admin, issuer, kind, {
+            "registry_number": registry_number,
+            "max_shares": rng.choice([1000, 2000]),
+            "issued_shares": 0,
+            "all_shares_issued": False,
+        }, level)
+    if kind == "start_maintenance":
+        return (admin, issuer, kind, rng.choice(MAINTENANCE_TASKS), level)
+    if kind == "continue_maintenance":
+        return (admin, issuer, kind, rng.choice([0, 1, 2, 5]), level)
+    if kind == "change_admin":
+        return (admin, rng.choice(issuers + WALLETS), kind, rng.choice(ACCOUNTS), level)
+    governance_sender = rng.choice([ADMIN] * 4 + ACCOUNTS[1:])
+    if kind == "create_company":
+        company = {"companyID": rng.choice(COMPANY_IDS), "shares": 1000, "admin": rng.choice(ACCOUNTS)}
+        return (governance_sender, "governance", kind, company, level)
+    if kind == "create_companies":
+        companies = [{"companyID": rng.choice(COMPANY_IDS), "shares": 1000, "admin": rng.choice(ACCOUNTS)} for i in range(rng.randint(1, 2))]
+        return (governance_sender, "governance", kind, companies, level)
+    registration = {"companyID": rng.choice(COMPANY_IDS), "company_address": issuer, "admin": rng.choice(ACCOUNTS)}
+    return (governance_sender, "governance", "register_company", registration, level)
+
+
+def random_sequence(rng, steps):
+    """Runs a random sequence on a fresh model and returns the chain, steps and outcomes."""
+    chain = new_chain()
+    setup = setup_steps()
+    sequence = []
+    outcomes = []
+    level = 1
+    for index in range(steps):
+        if index < len(setup):
+            step = setup[index]
+        else:
+            level += rng.choice([0, 0, 1])
+            step = random_step(rng, chain, level)
+        (sender, address, entrypoint, params, step_level) = step
+        try:
+            chain.call(sender, address, entrypoint, params, step_level)
+            outcomes.append(True)
+        except model.ModelFailure:
+            outcomes.append(False)
+        sequence.append(step)
+        check_invariants(chain, step_level)
+    return chain, sequence, outcomes
+
+
+def check_invariants(chain, level):
+    ticket_supply = {}
+    for contract in chain.contracts.values():
+        for ticket in getattr(contract, "share_balances", {}).values():
+            ticket_supply[ticket.ticketer] = ticket_supply.get(ticket.ticketer, 0) + ticket.amount
+
+    for address, contract in chain.contracts.items():
+        if not isinstance(contract, model.ShareIssuer):
+            continue
+        unclaimed_ticket = contract.issued_unclaimed_shares2.get(0)
+        unclaimed = contract.unclaimed_shares + (unclaimed_ticket.amount if unclaimed_ticket else 0)
+        ledger = contract.active_share_ledger
+        assert sum(ledger.values()) == contract.ledger_supply, "%s: ledger_supply is not the ledger total" % address
+        assert contract.ledger_supply + unclaimed == contract.issued_shares, "%s: claimed and unclaimed shares differ from issued_shares" % address
+        # Claimed allocations stay counted in allocated_shares
+        assert contract.allocated_shares == sum(contract.owners_map.values()) + contract.ledger_supply, "%s: allocated_shares is not the allocations plus claims" % address
+        assert contract.allocated_shares <= contract.issued_shares, "%s: more shares allocated than issued" % address
+        assert ticket_supply.get(address, 0) + unclaimed == contract.issued_shares, "%s: ticket supply differs from issued_shares" % address
+        assert contract.holder_count == len(ledger) == len(contract.holders) == len(contract.holder_positions), "%s: holder index size" % address
+        for owner, position in contract.holder_positions.items():
+            assert contract.holders[position] == owner, "%s: holder index of %s" % (address, owner)
+        assert contract.owner_count == len(contract.owners_map) == len(contract.owners) == len(contract.owner_positions), "%s: owner index size" % address
+        for owner, position in contract.owner_positions.items():
+            assert contract.owners[position] == owner, "%s: owner index of %s" % (address, owner)
+        for owner in set(ledger) | set(contract.balance_checkpoint_counts):
+            assert contract.balance_at(owner, level) == ledger.get(owner, 0), "%s: last checkpoint of %s" % (address, owner)
+        assert contract.supply_at(level) == contract.ledger_supply, "%s: last supply checkpoint" % address
+
+
+def to_scenario(value, addresses):
+    if isinstance(value, str):
+        return addresses[value]
+    if isinstance(value, list):
+        return [to_scenario(item, addresses) for item in value]
+    if isinstance(value, dict):
+        return sp.record(**{key: to_scenario(item, addresses) for key, item in value.items()})
+    return value
+
+
+def storage_checks(handle, contract, addresses):
+    """Yields (description, condition) pairs comparing a contract's storage with the model."""
+    names = list(addresses)
+    for field in contract.STORAGE:
+        value = getattr(contract, field)
+        data = getattr(handle.data, field)
+        if isinstance(value, dict):
+            for key, expected, key_expr in big_map_entries(field, value, names, addresses, contract):
+                entry = "%s[%r]" % (field, key)
+                if expected is None:
+                    yield entry, ~data.contains(key_expr)
+                else:
+                    yield entry, data.contains(key_expr)
+                    for check in value_checks(data[key_expr], expected, addresses):
+                        yield entry, check
+        elif field == "maintenance":
+            if value is None:
+                yield field, data.is_none()
+            else:
+                (task, cursor, allocated, supply) = value
+                state = data.unwrap_some()
+                yield field, data.is_some()
+                yield field, state.task == getattr(sp.variant, task)(())
+                yield field, (state.cursor == cursor) & (state.allocated == allocated) & (state.supply == supply)
+        elif field in ("registry_number", "max_shares"):
+            yield field, data.is_none() if value is None else data == sp.Some(value)
+        else:
+            yield field, data == to_scenario(value, addresses)
+
+
+def big_map_entries(field, value, names, addresses, contract):
+    """Keys to compare: every known address, every index up to one past the last, and any model key."""
+    if field in ("balance_checkpoints", "adminCompanies"):
+        counts = contract.balance_checkpoint_counts if field == "balance_checkpoints" else contract.adminCompanyCounts
+        keys = [(name, position) for name in names for position in range(counts.get(name, 0) + 1)]
+        return [(key, value.get(key), (addresses[key[0]], key[1])) for key in keys]
+    if field in ("holders", "owners", "supply_checkpoints", "issued_unclaimed_shares2", "deployedContracts"):
+        keys = sorted(set(value) | {0, max(value, default=-1) + 1} | (set(COMPANY_IDS) if field == "deployedContracts" else set()))
+        return [(key, value.get(key), key) for key in keys]
+    return [(name, value.get(name), addresses[name]) for name in names]
+
+
+def value_checks(data, expected, addresses):
+    if isinstance(expected, model.Ticket):
+        ticket = sp.fst(sp.read_ticket_raw(data))
+        return [ticket.ticketer == addresses[expected.ticketer], ticket.contents == expected.contents, ticket.amount == expected.amount]
+    if isinstance(expected, tuple):
+        return [data.level == expected[0], data.balance == expected[1]]
+    return [data == to_scenario(expected, addresses)]
+
+
+def replay(index, chain, sequence, outcomes):
+    """Replays a sequence in SmartPy and compares the final storage with the model."""
+    scenario = sp.test_scenario("ExampleContractDifferential_%d" % index, main)
+    scenario.h1("Differential replay %d" % index)
+    addresses = {name: sp.test_account(name).address for name in ACCOUNTS}
+    handles = {
+        "issuer": main.ShareIssuer(addresses[ADMIN]),
+        "legacy": main.TSWalletContract(addresses[ADMIN]),
+        "wallet0": main.ShareWallet(addresses["User0"]),
+        "wallet1": main.ShareWallet(addresses["User1"]),
+        "governance": main.Governance(governanceAdmin=addresses[ADMIN]),
+    }
+    for name, handle in handles.items():
+        scenario += handle
+        addresses[name] = handle.address
+
+    created = 0
+    for step, ((sender, address, entrypoint, params, level), valid) in enumerate(zip(sequence, outcomes)):
+        method = getattr(handles[address], entrypoint)
+        options = {"_sender": addresses[sender], "_level": level, "_valid": valid}
+        try:
+            if params is None:
+                method(**options)
+            elif entrypoint == "start_maintenance":
+                method(getattr(sp.variant, params)(()), **options)
+            elif isinstance(params, dict):
+                method(**{key: to_scenario(value, addresses) for key, value in params.items()}, **options)
+            else:
+                method(to_scenario(params, addresses), **options)
+        except Exception:
+            raise AssertionError("step %d, %s.%s(%r) from %s: the model expected %s" % (
+                step, address, entrypoint, params, sender, "success" if valid else "failure"))
+        if valid and entrypoint in ("create_company", "create_companies"):
+            count = 1 if entrypoint == "create_company" else len(params)
+            for offset in range(-count, 0):
+                name = "created%d" % created
+                handles[name] = scenario.dynamic_contract(main.ShareIssuer, offset=offset)
+                addresses[name] = handles[name].address
+                created += 1
+
+    scenario.h2("Storage compared with the model")
+    for name, handle in handles.items():
+        checks = list(storage_checks(handle, chain.contracts[name], addresses))
+        condition = checks[0][1]
+        for description, check in checks[1:]:
+            condition = condition & check
+        try:
+            scenario.verify(condition)
+        except Exception:
+            # Find the first differing entry
+            for description, check in checks:
+                try:
+                    scenario.verify(check)
+                except Exception:
+                    raise AssertionError("%s.%s differs from the model" % (name, description))
+            raise
+
+
+if "main" in __name__:
+    seed = int(os.environ.get("FUZZ_SEED", "0"))
+    sequence_count = int(os.environ.get("FUZZ_SEQUENCES", "25000"))
+    replay_count = int(os.environ.get("FUZZ_REPLAYS", "10"))
+    steps = int(os.environ.get("FUZZ_STEPS", "40"))
+    rng = random.Random(seed)
+
+    started = time.perf_counter()
+    replayed = []
+    succeeded = 0
+    for i in range(sequence_count):
+        (chain, sequence, outcomes) = random_sequence(rng, steps)
+        succeeded += sum(outcomes)
+        if i < replay_count:
+            replayed.append((chain, sequence, outcomes))
+    elapsed = time.perf_counter() - started
+    operations = sequence_count * steps
+    print("Model: %d operations (%d succeeded) in %.1fs, %.0f operations/s, invariants held" % (
+        operations, succeeded, elapsed, operations / elapsed))
+
+    failures = []
+    for index, (chain, sequence, outcomes) in enumerate(replayed):
+        @sp.add_test()
+        def differential():
+            try:
+                replay(index, chain, sequence, outcomes)
+            except Exception as error:
+                failures.append((index, error))
+
+    for index, error in failures:
+        print("REPLAY %d (FUZZ_SEED=%d) DIFFERS: %s" % (index, seed, error))
+    if failures:
+        sys.exit(1)
+    print("SmartPy: %d replayed sequences match the model" % len(replayed))
@@ -0,0 +1,476 @@
+"""Streaming cap table indexer for the companies of one Governance contract.
+
+TzKT-shaped operations are replayed on the contracts of
+example_contract_model.py: every company created by the Governance gets
+its ledger, allocations and issued shares in memory, updated one applied
+operation at a time instead of from storage diffs.
+
+Sources are either a file of JSON lines or an http(s) URL. Each line of a
+file is an operation, a list of operations, or a TzKT subscription
+message: {"type": 1, "state": level, "data": [...]} carries operations and
+{"type": 2, "state": level} rolls back every level above level. A URL is
+read in pages sorted by id, requested with ?id.gt=<last id>&limit=<n>;
+serve_operations starts a local stand-in for it.
+
+A snapshot is written every SNAPSHOT_INTERVAL levels, so a restart resumes
+after the last indexed operation. The previous value of every big_map key
+and field changed in the last MAX_REORG_DEPTH levels is kept, in the
+snapshot too, to undo those levels on a reorg.
+
+Run from this directory:
+
+    python example_contract_indexer.py GOVERNANCE SOURCE [SNAPSHOT]   # print the cap tables
+    python example_contract_indexer.py                               # self-check and benchmark
+
+INDEXER_COMPANIES (default 20) and INDEXER_HOLDERS (default 200) size the
+benchmark stream.
+"""
+
+import bisect
+import collections
+import http.server
+import json
+import os
+import pathlib
+import pickle
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import example_contract_model as model
+
+# TzKT subscription message types
+DATA_MESSAGE = 1
+REORG_MESSAGE = 2
+SNAPSHOT_INTERVAL = 100
+MAX_REORG_DEPTH = 10
+PAGE_SIZE = 1000
+# Entrypoints taking a variant, rendered by TzKT as {case: value}; the model takes the case name
+VARIANT_ENTRYPOINTS = {"start_maintenance"}
+
+
+class IndexerError(Exception):
+    pass
+
+
+class IndexedChain(model.Chain):
+    """Chain replaying operations that were already applied on chain.
+
+    Receiving entrypoints are not checked, and contracts originated by the
+    Governance take the addresses reported in their operation group. The
+    changes journaled by model.Chain are those of the level being indexed.
+    """
+    __slots__ = ("pending_originations",)
+
+    def __init__(self):
+        model.Chain.__init__(self)
+        self.pending_originations = collections.deque()
+
+    def originate(self, contract, address=None):
+        if address is None:
+            if not self.pending_originations:
+                raise IndexerError("Origination missing from the operation group")
+            address = self.pending_originations.popleft()
+        return model.Chain.originate(self, contract, address)
+
+    def require_entrypoint(self, address, entrypoint):
+        pass
+
+
+def decode(value):
+    """Converts a TzKT parameter value: nats are strings, tickets are {"address", "data", "amount"}."""
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    if isinstance(value, dict):
+        if set(value) == {"address", "data", "amount"}:
+            return model.Ticket(value["address"], decode(value["data"]), decode(value["amount"]))
+        return {key: decode(item) for key, item in value.items()}
+    return value
+
+
+class CapTableIndexer:
+    """Cap tables of every company created by one Governance, built from its operations.
+
+    Only companies originated through create_company or create_companies
+    are followed; register_company records contracts whose history the
+    indexer has not seen.
+    """
+
+    def __init__(self, governance, snapshot_path=None, snapshot_interval=SNAPSHOT_INTERVAL, max_reorg_depth=MAX_REORG_DEPTH):
+        self.governance = governance
+        self.snapshot_path = pathlib.Path(snapshot_path) if snapshot_path else None
+        self.snapshot_interval = snapshot_interval
+        self.max_reorg_depth = max_reorg_depth
+        self.chain = IndexedChain()
+        # Level of the last operation seen, and the id after which to resume
+        self.level = 0
+        self.last_id = 0
+        # level -> (last_id before the level, the changes made in the level)
+        self.undo = {}
+        # Contracts whose fields were journaled in the current level
+        self.touched = set()
+        # Levels up to final_level can no longer be rolled back
+        self.final_level = 0
+        self.snapshot_level = 0
+        self.group = []
+        self.applied = 0
+        if self.snapshot_path is not None and self.snapshot_path.exists():
+            self.load_snapshot()
+        else:
+            # The admin is set by the first applied Governance call, which only the admin can make
+            self.chain.originate(model.Governance(None), governance)
+
+    def feed(self, message):
+        """Indexes an operation, a list of operations or a TzKT subscription message."""
+        if isinstance(message, list):
+            for operation in message:
+                self.feed(operation)
+        elif message.get("type") == DATA_MESSAGE:
+            self.feed(message["data"])
+        elif message.get("type") == REORG_MESSAGE:
+            self.rollback(message["state"])
+        elif isinstance(message.get("type"), str):
+            self.add_operation(message)
+
+    def add_operation(self, operation):
+        if operation["id"] <= self.last_id:
+            # Already indexed before a restart
+            return
+        if operation["level"] > self.level:
+            self.start_level(operation["level"])
+        elif operation["level"] < self.level:
+            raise IndexerError("Operation %d at level %d after level %d" % (operation["id"], operation["level"], self.level))
+        self.last_id = operation["id"]
+        if operation.get("status", "applied") != "applied":
+            return
+        if self.group and self.group[0]["hash"] != operation["hash"]:
+            self.flush()
+        self.group.append(operation)
+
+    def start_level(self, level):
+        self.flush()
+        if self.snapshot_path is not None and self.level - self.snapshot_level >= self.snapshot_interval:
+            self.save_snapshot()
+        self.level = level
+        self.undo[level] = (self.last_id, [])
+        self.chain.changes = self.undo[level][1]
+        self.touched = set()
+        for old_level in [old_level for old_level in self.undo if old_level <= level - self.max_reorg_depth]:
+            del self.undo[old_level]
+            self.final_level = max(self.final_level, old_level)
+
+    def flush(self):
+        """Applies the buffered operation group; contracts it originates are known only once it is complete."""
+        group, self.group = self.group, []
+        self.chain.pending_originations.extend(
+            operation["originatedContract"]["address"]
+            for operation in group
+            if operation["type"] == "origination" and operation["sender"]["address"] == self.governance
+        )
+        for operation in group:
+            if operation["type"] == "transaction":
+                self.apply(operation)
+        self.chain.pending_originations.clear()
+
+    def apply(self, operation):
+        address = operation["target"]["address"]
+        contract = self.chain.contracts.get(address)
+        parameter = operation.get("parameter") or {}
+        entrypoint = parameter.get("entrypoint", "default")
+        if contract is None or entrypoint not in contract.ENTRYPOINTS:
+            return
+
+        if address not in self.touched:
+            self.chain.journal_fields(contract)
+            self.touched.add(address)
+        sender = operation["sender"]["address"]
+        if address == self.governance and contract.admin is None:
+            contract.admin = sender
+
+        ctx = model.Context(self.chain, sender, address, operation["level"])
+        method = getattr(contract, entrypoint)
+        params = decode(parameter.get("value"))
+        if entrypoint in VARIANT_ENTRYPOINTS:
+            params = next(iter(params))
+        try:
+            if params is None:
+                method(ctx)
+            elif isinstance(params, dict):
+                method(ctx, **params)
+            else:
+                method(ctx, params)
+        except model.ModelFailure as error:
+            raise IndexerError("Operation %d does not replay on %s: %s" % (operation["id"], address, error)) from error
+        self.applied += 1
+
+    def rollback(self, level):
+        """Undoes every operation above level, as TzKT reports after a reorg."""
+        if self.group and self.group[0]["level"] > level:
+            self.group = []
+        self.flush()
+        if level < self.final_level:
+            raise IndexerError("Cannot roll back to level %d, levels up to %d are final" % (level, self.final_level))
+        for undo_level in sorted((undo_level for undo_level in self.undo if undo_level > level), reverse=True):
+            (last_id, changes) = self.undo.pop(undo_level)
+            model.undo_changes(changes)
+            self.last_id = last_id
+        self.level = min(self.level, level)
+        self.chain.changes = self.undo[self.level][1] if self.level in self.undo else []
+        self.touched = set()
+
+    def close(self):
+        self.flush()
+        if self.snapshot_path is not None:
+            self.save_snapshot()
+
+    def save_snapshot(self):
+        state = {
+            "governance": self.governance,
+            "level": self.level,
+            "last_id": self.last_id,
+            "final_level": self.final_level,
+            "contracts": self.chain.contracts,
+            "undo": self.undo,
+        }
+        # Replace the previous snapshot only once the new one is complete
+        temporary_path = self.snapshot_path.with_name(self.snapshot_path.name + ".tmp")
+        with open(temporary_path, "wb") as snapshot_file:
+            pickle.dump(state, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, self.snapshot_path)
+        self.snapshot_level = self.level
+
+    def load_snapshot(self):
+        with open(self.snapshot_path, "rb") as snapshot_file:
+            state = pickle.load(snapshot_file)
+        if state["governance"] != self.governance:
+            raise IndexerError("Snapshot %s is for Governance %s" % (self.snapshot_path, state["governance"]))
+        self.level = self.snapshot_level = state["level"]
+        self.last_id = state["last_id"]
+        self.final_level = state["final_level"]
+        self.chain.contracts = state["contracts"]
+        for contract in self.chain.contracts.values():
+            self.chain.journal_maps(contract)
+        self.undo = state["undo"]
+        self.chain.changes = self.undo[self.level][1] if self.level in self.undo else []
+
+    def companies(self):
+        """Returns the indexed company addresses by registry number."""
+        deployed = self.chain.contracts[self.governance].deployedContracts
+        return {company_id: address for company_id, address in deployed.items() if address in self.chain.contracts}
+
+    def cap_table(self, company):
+        contract = self.chain.contracts[company]
+        return {
+            "registry_number": contract.registry_number,
+            "issued_shares": contract.issued_shares,
+            "allocated_shares": contract.allocated_shares,
+            "holders": dict(contract.active_share_ledger),
+            "allocations": dict(contract.owners_map),
+        }
+
+    def cap_tables(self):
+        return {address: self.cap_table(address) for address in self.companies().values()}
+
+
+def read_operations(path):
+    with open(path) as operations_file:
+        for line in operations_file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def fetch_operations(url, last_id=0, page_size=PAGE_SIZE):
+    """Yields pages of operations with an id above last_id."""
+    while True:
+        query = urllib.parse.urlencode({"id.gt": last_id, "limit": page_size})
+        with urllib.request.urlopen("%s?%s" % (url, query)) as response:
+            page = json.load(response)
+        if not page:
+            return
+        yield page
+        last_id = page[-1]["id"]
+        if len(page) < page_size:
+            return
+
+
+def operations_from(source, last_id=0):
+    if source.startswith(("http://", "https://")):
+        return fetch_operations(source, last_id)
+    return read_operations(source)
+
+
+def serve_operations(operations, host="127.0.0.1", port=0):
+    """Serves operations like fetch_operations expects, from a background thread.
+
+    Returns the server, to shut down when done, and the URL to index.
+    """
+    operations = sorted(operations, key=lambda operation: operation["id"])
+    ids = [operation["id"] for operation in operations]
+
+    class OperationsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+            start = bisect.bisect_right(ids, int(query.get("id.gt", ["0"])[0]))
+            limit = int(query.get("limit", [str(PAGE_SIZE)])[0])
+            body = json.dumps(operations[start:start + limit]).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), OperationsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://%s:%d/v1/operations" % server.server_address
+
+
+class OperationStream:
+    """Builds TzKT-shaped operations: one group per call, internal operations after their parent."""
+
+    def __init__(self, operations_per_level=50):
+        self.operations = []
+        self.operations_per_level = operations_per_level
+        self.level = 1
+
+    def group(self, *operations):
+        """Adds a group of (sender, target, entrypoint, value) calls and (sender, originated) originations."""
+        if len(self.operations) >= self.level * self.operations_per_level:
+            self.level += 1
+        group_hash = "oo%d" % len(self.operations)
+        for operation in operations:
+            entry = {
+                "id": len(self.operations) + 1,
+                "level": self.level,
+                "hash": group_hash,
+                "sender": {"address": operation[0]},
+                "status": "applied",
+            }
+            if len(operation) == 2:
+                entry.update(type="origination", originatedContract={"address": operation[1]})
+            else:
+                entry.update(type="transaction", target={"address": operation[1]}, parameter={"entrypoint": operation[2], "value": operation[3]})
+            self.operations.append(entry)
+
+
+def synthetic_operations(governance, company_count, holder_count, seed=0):
+    """Returns the operations creating, issuing, claiming and trading company_count companies,
+    and the resulting ledger of each company."""
+    rng = random.Random(seed)
+    admin = "tz1Admin"
+    stream = OperationStream()
+    companies = ["KT1Company%05d" % i for i in range(company_count)]
+    wallets = ["KT1Wallet%05d" % i for i in range(holder_count)]
+    ledgers = {}
+
+    for start in range(0, company_count, 10):
+        chunk = range(start, min(start + 10, company_count))
+        created = [{"companyID": str(i + 1), "shares": str(holder_count * 100), "admin": admin} for i in chunk]
+        stream.group((admin, governance, "create_companies", created), *[(governance, companies[i]) for i in chunk])
+
+    for company in companies:
+        ledger = ledgers[company] = {}
+        stream.group((admin, company, "issue_shares_lazy", {"shares_amount": str(holder_count * 100)}))
+        for start in range(0, holder_count, 50):
+            allocations = [{"owner_address": wallet, "amount": "100"} for wallet in wallets[start:start + 50]]
+            stream.group((admin, company, "add_share_owners", allocations))
+        for wallet in wallets:
+            ticket = {"address": company, "data": str(companies.index(company) + 1), "amount": "100"}
+            stream.group(
+                (admin, wallet, "claim_shares", company),
+                (wallet, company, "process_share_claim", {}),
+                (company, wallet, "receive_shares", {"issuer": company, "ticket": ticket}),
+            )
+            ledger[wallet] = 100
+        for i in range(holder_count):
+            (source, destination) = rng.sample(wallets, 2)
+            amount = rng.randint(1, ledger.get(source, 0)) if ledger.get(source, 0) else 0
+            if amount == 0:
+                continue
+            stream.group((source, company, "update_share_ledger", {"from_address": source, "to_address": destination, "amount": str(amount)}))
+            ledger[source] -= amount
+            if ledger[source] == 0:
+                del ledger[source]
+            ledger[destination] = ledger.get(destination, 0) + amount
+    return stream.operations, ledgers
+
+
+def index(governance, messages, **options):
+    indexer = CapTableIndexer(governance, **options)
+    for message in messages:
+        indexer.feed(message)
+    indexer.close()
+    return indexer
+
+
+def ledgers(indexer):
+    return {address: table["holders"] for address, table in indexer.cap_tables().items()}
+
+
+if "main" in __name__:
+    if len(sys.argv) > 2:
+        indexer = CapTableIndexer(sys.argv[1], snapshot_path=sys.argv[3] if len(sys.argv) > 3 else None)
+        for message in operations_from(sys.argv[2], indexer.last_id):
+            indexer.feed(message)
+        indexer.close()
+        print(json.dumps(indexer.cap_tables(), indent=2, sort_keys=True))
+        sys.exit(0)
+
+    governance = "KT1Governance"
+    company_count = int(os.environ.get("INDEXER_COMPANIES", "20"))
+    holder_count = int(os.environ.get("INDEXER_HOLDERS", "200"))
+    operations, expected = synthetic_operations(governance, company_count, holder_count)
+
+    with tempfile.TemporaryDirectory() as directory:
+        operations_path = pathlib.Path(directory, "operations.jsonl")
+        with open(operations_path, "w") as operations_file:
+            for operation in operations:
+                operations_file.write(json.dumps(operation) + "\n")
+
+        started = time.perf_counter()
+        from_file = index(governance, read_operations(operations_path))
+        elapsed = time.perf_counter() - started
+        assert ledgers(from_file) == expected, "file: ledgers differ from the operations"
+        print("File: %d operations (%d replayed) in %.2fs, %.0f operations/s" % (
+            len(operations), from_file.applied, elapsed, len(operations) / elapsed))
+
+        server, url = serve_operations(operations)
+        started = time.perf_counter()
+        from_http = index(governance, fetch_operations(url))
+        elapsed = time.perf_counter() - started
+        server.shutdown()
+        assert from_http.cap_tables() == from_file.cap_tables(), "http: cap tables differ from the file"
+        print("HTTP: %d operations in %.2fs, %.0f operations/s" % (len(operations), elapsed, len(operations) / elapsed))
+
+        # Stop halfway, then resume from the snapshot with the whole stream
+        snapshot_path = pathlib.Path(directory, "snapshot.pickle")
+        interrupted = index(governance, operations[:len(operations) // 2], snapshot_path=snapshot_path, snapshot_interval=5)
+        resumed = CapTableIndexer(governance, snapshot_path=snapshot_path)
+        assert resumed.last_id == interrupted.last_id, "resume: snapshot is behind the last operation"
+        started = time.perf_counter()
+        for operation in operations:
+            resumed.feed(operation)
+        resumed.close()
+        assert resumed.cap_tables() == from_file.cap_tables(), "resume: cap tables differ from the file"
+        print("Resume: from level %d of %d in %.2fs" % (interrupted.level, from_file.level, time.perf_counter() - started))
+
+        # Roll back the last levels, check against an indexer that never saw them, then replay them
+        fork_level = from_file.level - MAX_REORG_DEPTH // 2
+        before_fork = [operation for operation in operations if operation["level"] <= fork_level]
+        reorged = CapTableIndexer(governance)
+        reorged.feed(operations)
+        reorged.feed({"type": REORG_MESSAGE, "state": fork_level})
+        reorged.flush()
+        assert reorged.cap_tables() == index(governance, before_fork).cap_tables(), "reorg: rollback differs from the fork level"
+        reorged.feed({"type": DATA_MESSAGE, "state": from_file.level, "data": operations})
+        reorged.close()
+        assert reorged.cap_tables() == from_file.cap_tables(), "reorg: replay differs from the file"
+        print("Reorg: rolled back %d levels and replayed them" % (from_file.level - fork_level))
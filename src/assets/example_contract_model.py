@@ -0,0 +1,760 @@
+"""Pure-Python reference model of the contracts in example_contract.py.
+
+Every ShareIssuer, ShareWallet, TSWalletContract and Governance entrypoint
+and view is mirrored on plain Python state, field for field, so claim,
+transfer and ledger invariants can be checked over far more operations
+than the SmartPy interpreter can run. example_contract_differential.py
+replays sampled sequences through both and compares their storage.
+
+Addresses are plain strings, options are None or the value, big_maps are
+dicts and tickets are Ticket instances, which are never mutated. Like on
+chain, tickets cannot be created or split with a zero amount. A failing
+entrypoint raises ModelFailure and, like a failed operation on chain,
+leaves every contract as it was before the call; reading a missing
+big_map key is checked explicitly where the contract can fail on it. Internal operations run
+depth first, in the order they were emitted.
+"""
+
+
+class ModelFailure(Exception):
+    pass
+
+
+class Ticket:
+    __slots__ = ("ticketer", "contents", "amount")
+
+    def __init__(self, ticketer, contents, amount):
+        self.ticketer = ticketer
+        self.contents = contents
+        self.amount = amount
+
+    def __repr__(self):
+        return "Ticket(%r, %r, %d)" % (self.ticketer, self.contents, self.amount)
+
+
+def as_nat(value, error="Negative nat"):
+    if value < 0:
+        raise ModelFailure(error)
+    return value
+
+
+def require(condition, error):
+    if not condition:
+        raise ModelFailure(error)
+
+
+def unwrap_some(value, error="Not the proper variant constructor [Some] != [None]"):
+    require(value is not None, error)
+    return value
+
+
+def require_key(mapping, key):
+    """Fails like reading a missing big_map key on chain."""
+    require(key in mapping, "Missing big_map key")
+
+
+def mint_ticket(ticketer, contents, amount):
+    """Creates a ticket like sp.ticket, which fails on a zero amount."""
+    require(amount > 0, "Cannot create a ticket of zero")
+    return Ticket(ticketer, contents, amount)
+
+
+def join_tickets(first, second):
+    require(first.ticketer == second.ticketer and first.contents == second.contents, "Cannot join tickets")
+    return Ticket(first.ticketer, first.contents, first.amount + second.amount)
+
+
+def split_ticket(ticket, kept, sent):
+    require(kept > 0 and sent > 0 and kept + sent == ticket.amount, "Cannot split ticket")
+    return Ticket(ticket.ticketer, ticket.contents, kept), Ticket(ticket.ticketer, ticket.contents, sent)
+
+
+class Context:
+    """What an entrypoint can see of the chain: sp.sender, sp.self_address(), sp.level."""
+    __slots__ = ("chain", "sender", "self_address", "level")
+
+    def __init__(self, chain, sender, self_address, level):
+        self.chain = chain
+        self.sender = sender
+        self.self_address = self_address
+        self.level = level
+
+
+class Contract:
+    __slots__ = ()
+    # Storage fields, in the names used by example_contract.py
+    STORAGE = ()
+    ENTRYPOINTS = ()
+
+
+class Missing:
+    """The previous value of a key that was not set."""
+
+    def __reduce__(self):
+        return "MISSING"
+
+
+MISSING = Missing()
+
+
+class JournaledMap(dict):
+    """Big_map of an originated contract that records the previous value of
+    every key it changes in the journal of its chain."""
+    __slots__ = ("chain",)
+
+    def __init__(self, chain, items=()):
+        dict.__init__(self, items)
+        self.chain = chain
+
+    def __reduce__(self):
+        # The chain is set again when a snapshot is loaded
+        return (JournaledMap, (None, dict(self)))
+
+    def __setitem__(self, key, value):
+        self.chain.changes.append((self, key, self.get(key, MISSING)))
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.chain.changes.append((self, key, self[key]))
+        dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.chain.changes.append((self, key, self[key]))
+        return dict.pop(self, key, *default)
+
+
+def undo_changes(changes):
+    """Restores the previous values recorded in changes, latest first."""
+    # Values stored in big_maps are never mutated in place, so restoring them is enough
+    for (target, key, value) in reversed(changes):
+        if not isinstance(target, dict):
+            setattr(target, key, value)
+        elif value is MISSING:
+            dict.pop(target, key, None)
+        else:
+            dict.__setitem__(target, key, value)
+
+
+class WalletEntrypoints:
+    """Holder-wallet entrypoints shared by ShareWallet and TSWalletContract."""
+    __slots__ = ()
+
+    def claim_shares(self, ctx, destination):
+        return [(destination, "process_share_claim", None)]
+
+    def receive_shares(self, ctx, issuer, ticket):
+        held_ticket = self.share_balances.pop(issuer, None)
+        if held_ticket is None:
+            self.share_balances[issuer] = ticket
+        else:
+            self.share_balances[issuer] = join_tickets(held_ticket, ticket)
+        return []
+
+    def transfer_shares_batch(self, ctx, share, transfers):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        total_amount = sum(transfer["amount"] for transfer in transfers)
+        ctx.chain.require_entrypoint(share, "update_share_ledger_batch")
+
+        held_shares = unwrap_some(self.share_balances.pop(share, None), "No shares held from issuer")
+        require(total_amount <= held_shares.amount, "Insufficient shares held")
+        if total_amount < held_shares.amount:
+            rest, sent = split_ticket(held_shares, held_shares.amount - total_amount, total_amount)
+            self.share_balances[share] = rest
+        else:
+            sent = held_shares
+        return [(share, "update_share_ledger_batch", {"ticket": sent, "transfers": transfers})]
+
+
+class ShareWallet(WalletEntrypoints, Contract):
+    __slots__ = ("admin_address", "share_balances")
+    STORAGE = __slots__
+    ENTRYPOINTS = ("change_admin", "claim_shares", "receive_shares", "transfer_shares_batch")
+
+    def __init__(self, admin_address):
+        self.admin_address = admin_address
+        self.share_balances = {}
+
+    def change_admin(self, ctx, params):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.admin_address = params
+        return []
+
+
+class ShareIssuer(Contract):
+    __slots__ = (
+        "admin_address",
+        "active_share_ledger",
+        "holders",
+        "holder_positions",
+        "holder_count",
+        "ledger_supply",
+        "balance_checkpoints",
+        "balance_checkpoint_counts",
+        "supply_checkpoints",
+        "supply_checkpoint_count",
+        "registry_number",
+        "max_shares",
+        "issued_shares",
+        "allocated_shares",
+        "all_shares_issued",
+        "owners_map",
+        "owners",
+        "owner_positions",
+        "owner_count",
+        "migrated",
+        "maintenance",
+        "issued_unclaimed_shares2",
+        "unclaimed_shares",
+    )
+    STORAGE = __slots__
+    ENTRYPOINTS = (
+        "change_admin",
+        "add_company_data",
+        "change_max_shares",
+        "issue_shares_unclaimed2",
+        "issue_shares_lazy",
+        "add_share_owner",
+        "remove_share_owner",
+        "add_share_owners",
+        "remove_share_owners",
+        "migrate_share_owners",
+        "process_share_claim",
+        "claim_shares_direct",
+        "distribute_shares",
+        "update_share_ledger",
+        "update_share_ledger_batch",
+        "start_maintenance",
+        "continue_maintenance",
+    )
+
+    def __init__(self, admin_address, registry_number=None, max_shares=None):
+        self.admin_address = admin_address
+        self.active_share_ledger = {}
+        self.holders = {}
+        self.holder_positions = {}
+        self.holder_count = 0
+        self.ledger_supply = 0
+        self.balance_checkpoints = {}
+        self.balance_checkpoint_counts = {}
+        self.supply_checkpoints = {}
+        self.supply_checkpoint_count = 0
+        self.registry_number = registry_number
+        self.max_shares = max_shares
+        self.issued_shares = 0
+        self.allocated_shares = 0
+        self.all_shares_issued = False
+        self.owners_map = {}
+        self.owners = {}
+        self.owner_positions = {}
+        self.owner_count = 0
+        self.migrated = {}
+        # None, or (task, cursor, allocated, supply) with task the variant case name
+        self.maintenance = None
+        self.issued_unclaimed_shares2 = {}
+        self.unclaimed_shares = 0
+
+    def checkpoint_balance(self, ctx, owner):
+        count = self.balance_checkpoint_counts.get(owner, 0)
+        checkpoint = (ctx.level, self.active_share_ledger.get(owner, 0))
+        if count > 0 and self.balance_checkpoints[(owner, count - 1)][0] == ctx.level:
+            self.balance_checkpoints[(owner, count - 1)] = checkpoint
+        else:
+            self.balance_checkpoints[(owner, count)] = checkpoint
+            self.balance_checkpoint_counts[owner] = count + 1
+
+    def checkpoint_supply(self, ctx):
+        count = self.supply_checkpoint_count
+        checkpoint = (ctx.level, self.ledger_supply)
+        if count > 0 and self.supply_checkpoints[count - 1][0] == ctx.level:
+            self.supply_checkpoints[count - 1] = checkpoint
+        else:
+            self.supply_checkpoints[count] = checkpoint
+            self.supply_checkpoint_count = count + 1
+
+    def add_holder(self, owner):
+        if owner not in self.active_share_ledger:
+            self.holder_positions[owner] = self.holder_count
+            self.holders[self.holder_count] = owner
+            self.holder_count += 1
+
+    def remove_holder(self, owner):
+        del self.active_share_ledger[owner]
+        # Move the last holder into the freed position
+        position = self.holder_positions[owner]
+        last_position = as_nat(self.holder_count - 1)
+        last_holder = self.holders[last_position]
+        self.holders[position] = last_holder
+        self.holder_positions[last_holder] = position
+        self.holders.pop(last_position, None)
+        self.holder_positions.pop(owner, None)
+        self.holder_count = last_position
+
+    def add_owner(self, owner):
+        if owner not in self.owners_map:
+            self.owner_positions[owner] = self.owner_count
+            self.owners[self.owner_count] = owner
+            self.owner_count += 1
+
+    def remove_owner(self, owner):
+        del self.owners_map[owner]
+        # Move the last owner into the freed position
+        position = self.owner_positions[owner]
+        last_position = as_nat(self.owner_count - 1)
+        last_owner = self.owners[last_position]
+        self.owners[position] = last_owner
+        self.owner_positions[last_owner] = position
+        del self.owners[last_position]
+        del self.owner_positions[owner]
+        self.owner_count = last_position
+
+    def require_no_maintenance(self):
+        require(self.maintenance is None, "Maintenance in progress")
+
+    def credit_claim(self, ctx, owner, amount):
+        self.add_holder(owner)
+        self.active_share_ledger[owner] = self.active_share_ledger.get(owner, 0) + amount
+        self.checkpoint_balance(ctx, owner)
+
+    def take_unclaimed(self, ctx, amount, content):
+        """Takes amount shares from unclaimed_shares first, the rest off the unclaimed ticket."""
+        lazy_shares = min(self.unclaimed_shares, amount)
+        pooled_shares = amount - lazy_shares
+        taken = None
+        if pooled_shares > 0:
+            unclaimed = unwrap_some(self.issued_unclaimed_shares2.pop(0, None), "No unclaimed shares")
+            kept_shares = unclaimed.amount - pooled_shares
+            require(kept_shares >= 0, "Not enough unclaimed shares")
+            if kept_shares > 0:
+                rest, taken = split_ticket(unclaimed, kept_shares, pooled_shares)
+                self.issued_unclaimed_shares2[0] = rest
+            else:
+                taken = unclaimed
+        if lazy_shares > 0:
+            minted = mint_ticket(ctx.self_address, content, lazy_shares)
+            taken = minted if taken is None else join_tickets(minted, taken)
+        self.unclaimed_shares -= lazy_shares
+        return unwrap_some(taken)
+
+    def send_claimed_shares(self, ctx, destination, amount):
+        ctx.chain.require_entrypoint(destination, "receive_shares")
+        ticket = self.take_unclaimed(ctx, amount, unwrap_some(self.registry_number))
+        return [(destination, "receive_shares", {"issuer": ctx.self_address, "ticket": ticket})]
+
+    def change_admin(self, ctx, params):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.admin_address = params
+        return []
+
+    def add_company_data(self, ctx, registry_number, max_shares, issued_shares, all_shares_issued):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.registry_number = registry_number
+        self.max_shares = max_shares
+        return []
+
+    def change_max_shares(self, ctx, new_max_shares):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.max_shares = new_max_shares
+        return []
+
+    def issue_shares_unclaimed2(self, ctx, shares_amount):
+        ticket_content = unwrap_some(self.registry_number, "No registry number in storage")
+        require(self.issued_shares + shares_amount <= unwrap_some(self.max_shares), "Cannot issue this many shares")
+        issued = mint_ticket(ctx.self_address, ticket_content, shares_amount)
+        unclaimed = self.issued_unclaimed_shares2.pop(0, None)
+        self.issued_unclaimed_shares2[0] = issued if unclaimed is None else join_tickets(unclaimed, issued)
+        self.issued_shares += shares_amount
+        return []
+
+    def issue_shares_lazy(self, ctx, shares_amount):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        unwrap_some(self.registry_number, "No registry number in storage")
+        require(self.issued_shares + shares_amount <= unwrap_some(self.max_shares), "Cannot issue this many shares")
+        self.unclaimed_shares += shares_amount
+        self.issued_shares += shares_amount
+        return []
+
+    def add_share_owner(self, ctx, owner_address, amount):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.require_no_maintenance()
+        remaining_allocation = as_nat(self.allocated_shares - self.owners_map.get(owner_address, 0))
+        require(amount + remaining_allocation <= self.issued_shares, "Not enough shares issued")
+        self.add_owner(owner_address)
+        self.owners_map[owner_address] = amount
+        self.allocated_shares = remaining_allocation + amount
+        return []
+
+    def remove_share_owner(self, ctx, owner_address):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.require_no_maintenance()
+        require_key(self.owners_map, owner_address)
+        amount = self.owners_map[owner_address]
+        self.remove_owner(owner_address)
+        self.allocated_shares = as_nat(self.allocated_shares - amount)
+        return []
+
+    def add_share_owners(self, ctx, params):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.require_no_maintenance()
+        allocated_shares = self.allocated_shares
+        for entry in params:
+            previous_amount = self.owners_map.get(entry["owner_address"], 0)
+            allocated_shares = as_nat(allocated_shares - previous_amount) + entry["amount"]
+            self.add_owner(entry["owner_address"])
+            self.owners_map[entry["owner_address"]] = entry["amount"]
+        require(allocated_shares <= self.issued_shares, "Not enough shares issued")
+        self.allocated_shares = allocated_shares
+        return []
+
+    def remove_share_owners(self, ctx, params):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.require_no_maintenance()
+        allocated_shares = self.allocated_shares
+        for owner_address in params:
+            require_key(self.owners_map, owner_address)
+            allocated_shares = as_nat(allocated_shares - self.owners_map[owner_address])
+            self.remove_owner(owner_address)
+        self.allocated_shares = allocated_shares
+        return []
+
+    def migrate_share_owners(self, ctx, params):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.require_no_maintenance()
+        unwrap_some(self.registry_number, "No registry number in storage")
+        migrated_shares = 0
+        allocated_shares = self.allocated_shares
+        for entry in params:
+            previous_amount = self.owners_map.get(entry["owner_address"], 0)
+            imported = max(previous_amount, self.migrated.get(entry["owner_address"], 0))
+            if entry["amount"] > imported:
+                increase = entry["amount"] - imported
+                self.add_owner(entry["owner_address"])
+                self.owners_map[entry["owner_address"]] = previous_amount + increase
+                self.migrated[entry["owner_address"]] = entry["amount"]
+                allocated_shares += increase
+                migrated_shares += increase
+        require(self.issued_shares + migrated_shares <= unwrap_some(self.max_shares), "Cannot issue this many shares")
+        self.unclaimed_shares += migrated_shares
+        self.issued_shares += migrated_shares
+        self.allocated_shares = allocated_shares
+        return []
+
+    def claim(self, ctx, owner):
+        self.require_no_maintenance()
+        require(owner in self.owners_map, "Wallet not eligible claiming any shares")
+        claimable_shares = self.owners_map[owner]
+        self.remove_owner(owner)
+        require(claimable_shares > 0, "Your shares have not been issued yet")
+        self.credit_claim(ctx, owner, claimable_shares)
+        self.ledger_supply += claimable_shares
+        self.checkpoint_supply(ctx)
+        return self.send_claimed_shares(ctx, owner, claimable_shares)
+
+    def process_share_claim(self, ctx):
+        return self.claim(ctx, ctx.sender)
+
+    def claim_shares_direct(self, ctx, destination_address):
+        return self.claim(ctx, destination_address)
+
+    def distribute_shares(self, ctx, params):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.require_no_maintenance()
+        ticket_content = unwrap_some(self.registry_number, "No registry number in storage")
+        operations = []
+        distributed_shares = 0
+        for destination in params:
+            require(destination in self.owners_map, "Destination not eligible for claiming shares")
+            claimable_shares = self.owners_map[destination]
+            self.remove_owner(destination)
+            require(claimable_shares > 0, "No shares allocated to destination")
+            self.credit_claim(ctx, destination, claimable_shares)
+            distributed_shares += claimable_shares
+            ctx.chain.require_entrypoint(destination, "receive_shares")
+            ticket = mint_ticket(ctx.self_address, ticket_content, claimable_shares)
+            operations.append((destination, "receive_shares", {"issuer": ctx.self_address, "ticket": ticket}))
+
+        self.ledger_supply += distributed_shares
+        self.checkpoint_supply(ctx)
+
+        if distributed_shares > 0:
+            # The taken shares are burned, the destinations' tickets are minted above
+            self.take_unclaimed(ctx, distributed_shares, ticket_content)
+        return operations
+
+    def update_share_ledger(self, ctx, from_address, to_address, amount):
+        self.require_no_maintenance()
+        require(ctx.sender == from_address, "Only share owner can update ledger")
+        require(from_address in self.active_share_ledger, "Source address not in ledger")
+        require(self.active_share_ledger[from_address] >= amount, "Insufficient shares in ledger")
+
+        current_balance = self.active_share_ledger[from_address]
+        if current_balance == amount:
+            self.remove_holder(from_address)
+        else:
+            self.active_share_ledger[from_address] = current_balance - amount
+
+        if to_address in self.active_share_ledger:
+            self.active_share_ledger[to_address] += amount
+        else:
+            self.add_holder(to_address)
+            self.active_share_ledger[to_address] = amount
+
+        self.checkpoint_balance(ctx, from_address)
+        self.checkpoint_balance(ctx, to_address)
+        return []
+
+    def update_share_ledger_batch(self, ctx, ticket, transfers):
+        self.require_no_maintenance()
+        require(ticket.ticketer == ctx.self_address, "Ticket not issued by this contract")
+        require(ctx.sender in self.active_share_ledger, "Source address not in ledger")
+
+        for transfer in transfers:
+            require(transfer["to_address"] != ctx.sender, "Cannot transfer to sender")
+            require(transfer["amount"] > 0, "Cannot transfer zero shares")
+        moved_shares = sum(transfer["amount"] for transfer in transfers)
+        require(moved_shares == ticket.amount, "Ticket amount does not match transfers")
+        current_balance = as_nat(self.active_share_ledger[ctx.sender] - moved_shares, "Insufficient shares in ledger")
+
+        operations = []
+        for transfer in transfers:
+            self.credit_claim(ctx, transfer["to_address"], transfer["amount"])
+            ctx.chain.require_entrypoint(transfer["to_address"], "receive_shares")
+            shares = mint_ticket(ctx.self_address, ticket.contents, transfer["amount"])
+            operations.append((transfer["to_address"], "receive_shares", {"issuer": ctx.self_address, "ticket": shares}))
+
+        if current_balance == 0:
+            self.remove_holder(ctx.sender)
+        else:
+            self.active_share_ledger[ctx.sender] = current_balance
+        self.checkpoint_balance(ctx, ctx.sender)
+        return operations
+
+    def start_maintenance(self, ctx, task):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        self.require_no_maintenance()
+        self.maintenance = (task, 0, 0, 0)
+        return []
+
+    def continue_maintenance(self, ctx, limit):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        (task, start, allocated, supply) = unwrap_some(self.maintenance, "No maintenance in progress")
+        if task == "clear_share_owners":
+            processed = 0
+            while processed < limit and self.owner_count > 0:
+                last_position = self.owner_count - 1
+                owner = self.owners[last_position]
+                self.allocated_shares = as_nat(self.allocated_shares - self.owners_map[owner])
+                del self.owners_map[owner]
+                del self.owners[last_position]
+                del self.owner_positions[owner]
+                self.owner_count = last_position
+                processed += 1
+            if self.owner_count == 0:
+                self.maintenance = None
+            return []
+
+        cursor = start
+        end = self.owner_count + self.holder_count
+        while cursor < end and cursor - start < limit:
+            if cursor < self.owner_count:
+                allocated += self.owners_map[self.owners[cursor]]
+            else:
+                supply += self.active_share_ledger[self.holders[cursor - self.owner_count]]
+            cursor += 1
+        if cursor == end:
+            self.ledger_supply = supply
+            self.checkpoint_supply(ctx)
+            self.allocated_shares = allocated + supply
+            self.maintenance = None
+        else:
+            self.maintenance = (task, cursor, allocated, supply)
+        return []
+
+    def balance_of(self, owner):
+        return self.active_share_ledger.get(owner, 0)
+
+    def unclaimed_of(self, owner):
+        return self.owners_map.get(owner, 0)
+
+    def total_supply(self):
+        return self.ledger_supply
+
+    def cap_table(self, offset, limit):
+        end = min(offset + limit, self.holder_count)
+        return [
+            {"holder": self.holders[position], "balance": self.active_share_ledger[self.holders[position]]}
+            for position in range(offset, end)
+        ]
+
+    def balance_at(self, owner, level):
+        balance = 0
+        for position in range(self.balance_checkpoint_counts.get(owner, 0)):
+            checkpoint_level, checkpoint_balance = self.balance_checkpoints[(owner, position)]
+            if checkpoint_level > level:
+                break
+            balance = checkpoint_balance
+        return balance
+
+    def supply_at(self, level):
+        supply = 0
+        for position in range(self.supply_checkpoint_count):
+            checkpoint_level, checkpoint_supply = self.supply_checkpoints[position]
+            if checkpoint_level > level:
+                break
+            supply = checkpoint_supply
+        return supply
+
+
+class TSWalletContract(WalletEntrypoints, ShareIssuer):
+    __slots__ = ("share_balances",)
+    STORAGE = ShareIssuer.STORAGE + __slots__
+    ENTRYPOINTS = ShareIssuer.ENTRYPOINTS + ("claim_shares", "receive_shares", "transfer_shares_batch", "transfer_shares")
+
+    def __init__(self, admin_address):
+        ShareIssuer.__init__(self, admin_address)
+        self.share_balances = {}
+
+    def transfer_shares(self, ctx, share, amount, destination):
+        require(ctx.sender == self.admin_address, "Caller not Admin")
+        held_shares = self.share_balances.pop(share, None)
+        if held_shares is None:
+            return []
+        if amount < held_shares.amount:
+            rest, sent = split_ticket(held_shares, held_shares.amount - amount, amount)
+            self.share_balances[held_shares.ticketer] = rest
+        else:
+            sent = held_shares
+        ctx.chain.require_entrypoint(share, "update_share_ledger")
+        ctx.chain.require_entrypoint(destination, "receive_claimed_shares")
+        return [
+            (share, "update_share_ledger", {"from_address": ctx.self_address, "to_address": destination, "amount": amount}),
+            (destination, "receive_claimed_shares", {"issuer": held_shares.ticketer, "ticket": sent}),
+        ]
+
+
+class Governance(Contract):
+    __slots__ = ("admin", "deployedContracts", "registryNumbers", "adminCompanies", "adminCompanyCounts")
+    STORAGE = __slots__
+    ENTRYPOINTS = ("create_company", "create_companies", "register_company")
+
+    def __init__(self, admin):
+        self.admin = admin
+        self.deployedContracts = {}
+        self.registryNumbers = {}
+        self.adminCompanies = {}
+        self.adminCompanyCounts = {}
+
+    def add_company(self, companyID, company_address, admin):
+        require(companyID not in self.deployedContracts, "Company already registered")
+        self.deployedContracts[companyID] = company_address
+        self.registryNumbers[company_address] = companyID
+        count = self.adminCompanyCounts.get(admin, 0)
+        self.adminCompanies[(admin, count)] = companyID
+        self.adminCompanyCounts[admin] = count + 1
+
+    def originate_company(self, ctx, companyID, shares, admin):
+        company = ctx.chain.originate(ShareIssuer(admin, registry_number=companyID, max_shares=shares))
+        self.add_company(companyID, company, admin)
+
+    def create_company(self, ctx, companyID, shares, admin):
+        require(ctx.sender == self.admin, "NotAdmin")
+        self.originate_company(ctx, companyID, shares, admin)
+        return []
+
+    def create_companies(self, ctx, params):
+        require(ctx.sender == self.admin, "NotAdmin")
+        for company in params:
+            self.originate_company(ctx, company["companyID"], company["shares"], company["admin"])
+        return []
+
+    def register_company(self, ctx, companyID, company_address, admin):
+        require(ctx.sender == self.admin, "NotAdmin")
+        self.add_company(companyID, company_address, admin)
+        return []
+
+    def registry_number_of(self, company_address):
+        return self.registryNumbers.get(company_address)
+
+    def companies_of(self, admin, offset, limit):
+        end = min(offset + limit, self.adminCompanyCounts.get(admin, 0))
+        return [self.adminCompanies[(admin, position)] for position in range(offset, end)]
+
+
+class Chain:
+    """Originated contracts, keyed by address, and the operations between them.
+
+    The big_maps of every originated contract are JournaledMaps, and each
+    change is appended to changes as (map, key, previous value), or
+    (contract, field, previous value) for the other fields, until
+    undo_changes rolls it back.
+    """
+    __slots__ = ("contracts", "originated", "changes")
+
+    def __init__(self):
+        self.contracts = {}
+        self.originated = 0
+        self.changes = []
+
+    def originate(self, contract, address=None):
+        """Adds a contract; contracts created by other contracts are named created0, created1..."""
+        if address is None:
+            address = "created%d" % self.originated
+            self.originated += 1
+        self.journal_maps(contract)
+        self.changes.append((self.contracts, address, self.contracts.get(address, MISSING)))
+        self.contracts[address] = contract
+        return address
+
+    def journal_maps(self, contract):
+        for field in contract.STORAGE:
+            value = getattr(contract, field)
+            if isinstance(value, JournaledMap):
+                value.chain = self
+            elif isinstance(value, dict):
+                setattr(contract, field, JournaledMap(self, value))
+
+    def journal_fields(self, contract):
+        """Records the fields of contract that are not big_maps, before it is changed."""
+        for field in contract.STORAGE:
+            value = getattr(contract, field)
+            if not isinstance(value, JournaledMap):
+                self.changes.append((contract, field, value))
+
+    def require_entrypoint(self, address, entrypoint):
+        """Fails like sp.contract(...).unwrap_some() when address has no such entrypoint."""
+        contract = self.contracts.get(address)
+        require(contract is not None and entrypoint in contract.ENTRYPOINTS, "Not the proper variant constructor [Some] != [None]")
+
+    def call(self, sender, address, entrypoint, params=None, level=0):
+        """Runs an operation and the internal operations it emits.
+
+        Raises ModelFailure, with every contract restored, if any of them fails.
+        """
+        self.changes = []
+        touched = set()
+        originated = self.originated
+        operations = [(sender, address, entrypoint, params)]
+        try:
+            while operations:
+                (sender, address, entrypoint, params) = operations.pop(0)
+                self.require_entrypoint(address, entrypoint)
+                contract = self.contracts[address]
+                if address not in touched:
+                    self.journal_maps(contract)
+                    self.journal_fields(contract)
+                    touched.add(address)
+                ctx = Context(self, sender, address, level)
+                method = getattr(contract, entrypoint)
+                if params is None:
+                    emitted = method(ctx)
+                elif isinstance(params, dict):
+                    emitted = method(ctx, **params)
+                else:
+                    emitted = method(ctx, params)
+                operations[:0] = [(address,) + operation for operation in emitted]
+        except ModelFailure:
+            undo_changes(self.changes)
+            self.originated = originated
+            raise
+        finally:
+            self.changes = []
@@ -0,0 +1,457 @@
+"""Level-aware read-through cache and batched fetcher for company storages.
+
+StorageService reads the companies of one Governance from a TzKT-style
+indexer API and fetches their storages concurrently over a pool of
+keep-alive connections. Storages are cached by (address, last modified
+level) with LRU eviction, so a cached storage stays valid until its
+contract changes. The last modified levels are looked up in batches and
+kept until the next block is notified through new_block, or seen by
+follow_head. The level of the Governance is looked up again after every
+block, so new companies are seen without naming it in new_block.
+
+The API is read at:
+
+    /v1/head                                                 {"level": ..., "hash": ...}
+    /v1/contracts?address.in=...&select=address,lastActivity
+    /v1/contracts/{address}/storage
+    /v1/contracts/{governance}/bigmaps/deployedContracts/keys?active=true&select=key,value
+
+serve_indexer_api starts a local stand-in for these endpoints.
+
+Run from this directory to check the service against the stand-in and
+report its hit rate and latency:
+
+    python example_contract_storage_cache.py
+
+CACHE_COMPANIES (default 200) sets the number of companies and
+CACHE_API_LATENCY (default 0.005) the stand-in's delay per request, in
+seconds.
+"""
+
+import asyncio
+import collections
+import http.client
+import http.server
+import json
+import os
+import queue
+import re
+import threading
+import time
+import urllib.parse
+
+import example_contract_indexer as indexer
+
+POOL_SIZE = 8
+CACHE_SIZE = 1024
+# Addresses per last modified level lookup, and keys per big_map page
+BATCH_SIZE = 100
+PAGE_SIZE = 1000
+LATENCY_SAMPLES = 10000
+
+
+class LevelCache:
+    """LRU cache of values keyed by (address, level)."""
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, address, level):
+        key = (address, level)
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, address, level, value):
+        self.entries[(address, level)] = value
+        self.entries.move_to_end((address, level))
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def discard_above(self, level):
+        """Drops values modified after level, which a reorg has undone."""
+        for key in [key for key in self.entries if key[1] > level]:
+            del self.entries[key]
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ConnectionPool:
+    """Keep-alive HTTP connections to one host, each used by one request at a time."""
+
+    def __init__(self, base_url, size=POOL_SIZE):
+        url = urllib.parse.urlsplit(base_url)
+        connection_class = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+        self.prefix = url.path.rstrip("/")
+        self.connections = queue.LifoQueue()
+        for i in range(size):
+            self.connections.put(connection_class(url.hostname, url.port))
+
+    def get_json(self, path):
+        connection = self.connections.get()
+        try:
+            try:
+                connection.request("GET", self.prefix + path)
+                response = connection.getresponse()
+            except (http.client.HTTPException, OSError):
+                # The server closed the idle connection: reconnect once
+                connection.close()
+                connection.request("GET", self.prefix + path)
+                response = connection.getresponse()
+            body = response.read()
+            if response.status != 200:
+                raise http.client.HTTPException("GET %s: %d" % (path, response.status))
+            return json.loads(body)
+        finally:
+            self.connections.put(connection)
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
+
+
+class StorageService:
+    """Company storages of one Governance, read through a LevelCache."""
+
+    def __init__(self, base_url, governance, pool_size=POOL_SIZE, cache_size=CACHE_SIZE):
+        self.governance = governance
+        self.pool = ConnectionPool(base_url, pool_size)
+        self.requests = asyncio.Semaphore(pool_size)
+        self.cache = LevelCache(cache_size)
+        # Last modified level of each address, valid until the next block
+        self.levels = {}
+        self.head = None
+        self.head_hash = None
+        self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    async def get_json(self, path):
+        async with self.requests:
+            return await asyncio.to_thread(self.pool.get_json, path)
+
+    def new_block(self, level, block_hash=None, addresses=None):
+        """Invalidates the last modified levels after a new block.
+
+        Only the levels of addresses and of the Governance are dropped when
+        the block's changed contracts are known. A level below the head, or
+        the head's level with another hash, is a reorg: the block at level
+        replaces the one seen before, so every storage modified from level
+        on is dropped too.
+        """
+        reorg = self.head is not None and (
+            level < self.head
+            or level == self.head and block_hash is not None and self.head_hash is not None and block_hash != self.head_hash
+        )
+        if reorg:
+            self.cache.discard_above(level - 1)
+            self.levels.clear()
+        elif addresses is None:
+            self.levels.clear()
+        else:
+            for address in [self.governance, *addresses]:
+                self.levels.pop(address, None)
+        self.head = level
+        self.head_hash = block_hash
+
+    async def follow_head(self, poll_interval=1.0):
+        """Polls /v1/head and notifies new_block of every level change."""
+        while True:
+            head = await self.get_json("/v1/head")
+            if head["level"] != self.head or head["hash"] != self.head_hash:
+                self.new_block(head["level"], head["hash"])
+            await asyncio.sleep(poll_interval)
+
+    async def last_levels(self, addresses):
+        """Returns the last modified level of each address, None for those the API does not know."""
+        missing = [address for address in addresses if address not in self.levels]
+        batches = [missing[start:start + BATCH_SIZE] for start in range(0, len(missing), BATCH_SIZE)]
+        pages = await asyncio.gather(*[
+            self.get_json("/v1/contracts?" + urllib.parse.urlencode({
+                "address.in": ",".join(batch),
+                "select": "address,lastActivity",
+                "limit": len(batch),
+            }))
+            for batch in batches
+        ])
+        for page in pages:
+            for contract in page:
+                self.levels[contract["address"]] = contract["lastActivity"]
+        return {address: self.levels.get(address) for address in addresses}
+
+    async def storages(self, addresses):
+        """Returns the storage of each address, fetching only those modified since they were cached.
+
+        Addresses the API does not know yet are left out.
+        """
+        started = time.perf_counter()
+        levels = await self.last_levels(addresses)
+        storages = {}
+        fetched = []
+        for address in addresses:
+            if levels[address] is None:
+                continue
+            storage = self.cache.get(address, levels[address])
+            if storage is None:
+                fetched.append(address)
+            else:
+                storages[address] = storage
+                self.latencies.append(time.perf_counter() - started)
+
+        async def fetch(address):
+            storage = await self.get_json("/v1/contracts/%s/storage" % address)
+            self.cache.put(address, levels[address], storage)
+            storages[address] = storage
+            self.latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*[fetch(address) for address in fetched])
+        return storages
+
+    async def companies(self):
+        """Returns the company addresses of Governance.deployedContracts by registry number."""
+        level = (await self.last_levels([self.governance]))[self.governance]
+        if level is None:
+            return {}
+        cached = self.cache.get(("companies", self.governance), level)
+        if cached is not None:
+            return cached
+        companies = {}
+        offset = 0
+        while True:
+            page = await self.get_json("/v1/contracts/%s/bigmaps/deployedContracts/keys?%s" % (
+                self.governance,
+                urllib.parse.urlencode({"active": "true", "select": "key,value", "limit": PAGE_SIZE, "offset": offset}),
+            ))
+            for entry in page:
+                companies[int(entry["key"])] = entry["value"]
+            if len(page) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+        self.cache.put(("companies", self.governance), level, companies)
+        return companies
+
+    async def portfolio(self):
+        """Returns the storage of every company, by registry number."""
+        companies = await self.companies()
+        storages = await self.storages(list(companies.values()))
+        return {company_id: storages[address] for company_id, address in companies.items() if address in storages}
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            "hits": self.cache.hits,
+            "misses": self.cache.misses,
+            "hit_rate": self.cache.hit_rate(),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+
+    def close(self):
+        self.pool.close()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def block_hash(level, branch=0):
+    """A stand-in block hash, distinct for each level and branch."""
+    return "BL%d_%d" % (level, branch)
+
+
+class IndexerApiState:
+    """What the stand-in indexer API serves: the head block, contracts and Governance companies."""
+
+    def __init__(self, governance, head=0):
+        self.governance = governance
+        self.head = head
+        self.head_hash = block_hash(head)
+        # address -> (last modified level, storage)
+        self.contracts = {governance: (head, {})}
+        self.deployed = {}
+        self.requests = 0
+
+    def set_storage(self, address, level, storage):
+        self.contracts[address] = (level, storage)
+        if level > self.head:
+            self.head = level
+            self.head_hash = block_hash(level)
+
+    def add_company(self, company_id, address, level, storage):
+        self.deployed[company_id] = address
+        self.set_storage(address, level, storage)
+        self.contracts[self.governance] = (level, self.contracts[self.governance][1])
+
+
+def serve_indexer_api(state, latency=0.0, host="127.0.0.1", port=0):
+    """Serves state on the endpoints StorageService reads, from a background thread.
+
+    Every request is delayed by latency seconds. Returns the server, to shut
+    down when done, and its base URL.
+    """
+
+    class IndexerApiHandler(http.server.BaseHTTPRequestHandler):
+        # Keep connections alive between requests, without delaying the reply's last packet
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            state.requests += 1
+            time.sleep(latency)
+            url = urllib.parse.urlsplit(self.path)
+            query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+            storage = re.fullmatch(r"/v1/contracts/(\w+)/storage", url.path)
+            keys = re.fullmatch(r"/v1/contracts/(\w+)/bigmaps/deployedContracts/keys", url.path)
+            if url.path == "/v1/head":
+                self.reply({"level": state.head, "hash": state.head_hash})
+            elif url.path == "/v1/contracts":
+                addresses = query.get("address.in", "").split(",")
+                self.reply([
+                    {"address": address, "lastActivity": state.contracts[address][0]}
+                    for address in addresses if address in state.contracts
+                ])
+            elif storage and storage.group(1) in state.contracts:
+                self.reply(state.contracts[storage.group(1)][1])
+            elif keys and keys.group(1) == state.governance:
+                entries = [{"key": str(key), "value": value} for key, value in sorted(state.deployed.items())]
+                offset = int(query.get("offset", "0"))
+                self.reply(entries[offset:offset + int(query.get("limit", str(PAGE_SIZE)))])
+            else:
+                self.send_error(404)
+
+        def reply(self, value):
+            body = json.dumps(value).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), IndexerApiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://%s:%d" % server.server_address
+
+
+def sequential_portfolio(base_url, governance):
+    """Fetches the portfolio like the current backend: one new connection per request, one company at a time."""
+    url = urllib.parse.urlsplit(base_url)
+
+    def get_json(path):
+        connection = http.client.HTTPConnection(url.hostname, url.port)
+        try:
+            connection.request("GET", path)
+            return json.loads(connection.getresponse().read())
+        finally:
+            connection.close()
+
+    keys = get_json("/v1/contracts/%s/bigmaps/deployedContracts/keys?active=true&select=key,value&limit=%d" % (governance, PAGE_SIZE))
+    return {int(entry["key"]): get_json("/v1/contracts/%s/storage" % entry["value"]) for entry in keys}
+
+
+async def check_service(base_url, state):
+    service = StorageService(base_url, state.governance)
+    expected = {company_id: state.contracts[address][1] for company_id, address in state.deployed.items()}
+
+    started = time.perf_counter()
+    assert await service.portfolio() == expected, "cold: portfolio differs from the API"
+    print("Cold portfolio: %.3fs, %d requests" % (time.perf_counter() - started, state.requests))
+
+    # An empty block: only the level of the Governance is looked up again
+    state.head += 1
+    state.head_hash = block_hash(state.head)
+    service.new_block(state.head, state.head_hash, addresses=[])
+    requests = state.requests
+    started = time.perf_counter()
+    assert await service.portfolio() == expected, "warm: portfolio differs from the API"
+    assert state.requests == requests + 1, "warm: unchanged block refetched storages"
+    print("Warm portfolio, unchanged block: %.3fs, 1 request" % (time.perf_counter() - started))
+
+    # A block adds a company, and only the new company is named as changed
+    company_id, address = max(state.deployed) + 1, "KT1NewCompany"
+    storage = dict(next(iter(expected.values())))
+    state.add_company(company_id, address, state.head + 1, storage)
+    expected[company_id] = storage
+    service.new_block(state.head, state.head_hash, addresses=[address])
+    assert await service.portfolio() == expected, "new company: companies not invalidated"
+    assert await service.storages(["KT1Unknown"]) == {}, "unknown address: not left out"
+
+    # A new block changes a tenth of the companies; the head is only known by polling
+    head = state.head + 1
+    changed = list(state.deployed.items())[::10]
+    for company_id, address in changed:
+        storage = dict(state.contracts[address][1], issued_shares=state.contracts[address][1]["issued_shares"] + 1)
+        state.set_storage(address, head, storage)
+        expected[company_id] = storage
+    state.set_storage(state.governance, head, {})
+    follower = asyncio.ensure_future(service.follow_head(poll_interval=60))
+    while service.head != head:
+        await asyncio.sleep(0.001)
+    follower.cancel()
+    requests = state.requests
+    started = time.perf_counter()
+    assert await service.portfolio() == expected, "changed: portfolio differs from the API"
+    # The Governance alone, then the companies in batches
+    lookups = 1 + -(-len(state.deployed) // BATCH_SIZE)
+    assert state.requests - requests == lookups + 1 + len(changed), "changed: unchanged storages were refetched"
+    print("Portfolio after %d changes: %.3fs, %d requests" % (len(changed), time.perf_counter() - started, state.requests - requests))
+
+    # Another block at the same level replaces the head, changing a company differently
+    company_id, address = changed[0]
+    storage = dict(expected[company_id], issued_shares=expected[company_id]["issued_shares"] + 1)
+    state.contracts[address] = (head, storage)
+    state.head_hash = block_hash(head, branch=1)
+    expected[company_id] = storage
+    follower = asyncio.ensure_future(service.follow_head(poll_interval=60))
+    while service.head_hash != state.head_hash:
+        await asyncio.sleep(0.001)
+    follower.cancel()
+    assert await service.portfolio() == expected, "same-level reorg: storage of the replaced block kept"
+
+    # A reorg back to the previous level drops the storages of the undone block
+    service.new_block(head - 1)
+    assert not [key for key in service.cache.entries if key[1] >= head], "reorg: storages of the undone block kept"
+
+    stats = service.stats()
+    print("Hit rate %.1f%% (%d hits, %d misses), p50 %.1fms, p99 %.1fms" % (
+        stats["hit_rate"] * 100, stats["hits"], stats["misses"], stats["p50_ms"], stats["p99_ms"]))
+    service.close()
+
+    small = LevelCache(size=2)
+    for level in range(3):
+        small.put("KT1", level, level)
+    assert small.get("KT1", 0) is None and small.get("KT1", 2) == 2, "LRU: oldest entry not evicted"
+
+
+if "main" in __name__:
+    company_count = int(os.environ.get("CACHE_COMPANIES", "200"))
+    latency = float(os.environ.get("CACHE_API_LATENCY", "0.005"))
+
+    # Company storages as indexed from a synthetic operation stream
+    governance = "KT1Governance"
+    operations, ledgers = indexer.synthetic_operations(governance, company_count, 10)
+    cap_tables = indexer.index(governance, operations)
+    last_levels = {}
+    for operation in operations:
+        last_levels[operation.get("target", operation.get("originatedContract"))["address"]] = operation["level"]
+    state = IndexerApiState(governance)
+    for company_id, address in cap_tables.companies().items():
+        state.add_company(company_id, address, last_levels[address], cap_tables.cap_table(address))
+
+    server, base_url = serve_indexer_api(state, latency)
+    started = time.perf_counter()
+    sequential = sequential_portfolio(base_url, governance)
+    print("Sequential portfolio without cache: %.3fs, %d requests" % (time.perf_counter() - started, state.requests))
+    state.requests = 0
+    asyncio.run(check_service(base_url, state))
+    server.shutdown()
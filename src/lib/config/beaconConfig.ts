@@ -3,18 +3,15 @@ import { TezosToolkit } from '@taquito/taquito';
 import { BeaconWallet } from '@taquito/beacon-wallet';
 import { walletStore } from '$lib/stores/beaconStore.svelte';
 import { beaconState } from '$lib/stores/beaconStore.svelte';
+import { SELECTED_NETWORK, SELECTED_RPC_URL } from './networkConfig';
 
-const rpcUrl_teztnets = "https://rpc.ghostnet.teztnets.com";
-const rpcUrl_smartpy = "https://ghostnet.smartpy.io";
-const rpcUrl_tzkt = "https://rpc.tzkt.io/ghostnet";
-const rpcUrl_mainnet = "https://rpc.tzkt.io/mainnet";
-const SELECTED_RPC_URL = rpcUrl_mainnet;
+export { SELECTED_NETWORK, SELECTED_RPC_URL };
 
 // Singleton instances
 export const Tezos = new TezosToolkit(SELECTED_RPC_URL);
 export const wallet = new BeaconWallet({ 
     name: "Tokenshare Beacon Wallet", 
-    preferredNetwork: NetworkType.MAINNET 
+    preferredNetwork: SELECTED_NETWORK as NetworkType
 });
 
 Tezos.setWalletProvider(wallet);
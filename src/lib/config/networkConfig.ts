@@ -0,0 +1,14 @@
+// Network endpoints, kept free of wallet setup so server routes can import them
+const rpcUrl_teztnets = "https://rpc.ghostnet.teztnets.com";
+const rpcUrl_smartpy = "https://ghostnet.smartpy.io";
+const rpcUrl_tzkt = "https://rpc.tzkt.io/ghostnet";
+const rpcUrl_mainnet = "https://rpc.tzkt.io/mainnet";
+
+const networks = {
+    mainnet: { rpcUrl: rpcUrl_mainnet, tzktApiUrl: "https://api.mainnet.tzkt.io" },
+    ghostnet: { rpcUrl: rpcUrl_tzkt, tzktApiUrl: "https://api.ghostnet.tzkt.io" },
+};
+
+export const SELECTED_NETWORK: keyof typeof networks = "mainnet";
+export const SELECTED_RPC_URL = networks[SELECTED_NETWORK].rpcUrl;
+export const SELECTED_TZKT_API_URL = networks[SELECTED_NETWORK].tzktApiUrl;
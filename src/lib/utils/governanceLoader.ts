@@ -1,15 +1,49 @@
 import { governanceStorageData } from '../stores/governanceStorage.svelte';
+import { SELECTED_TZKT_API_URL } from '../config/networkConfig';
 import { get } from 'svelte/store';
 
+interface TzktBigMapKey {
+  id: number;
+  key: string;
+  value: string;
+}
+
+const BIGMAP_PAGE_SIZE = 1000;
+
+// deployedContracts is a big_map: TzKT returns its id in the storage, so the
+// entries have to be fetched from the bigmap keys endpoint instead, one page
+// at a time after the id of the last key read.
+async function resolveDeployedContracts(deployedContracts: number | Record<string, string>) {
+  if (typeof deployedContracts !== 'number') {
+    return deployedContracts;
+  }
+  const entries: Record<string, string> = {};
+  let lastId = 0;
+  while (true) {
+    const response = await fetch(
+      `${SELECTED_TZKT_API_URL}/v1/bigmaps/${deployedContracts}/keys` +
+      `?active=true&sort.asc=id&offset.cr=${lastId}&limit=${BIGMAP_PAGE_SIZE}`
+    );
+    const keys: TzktBigMapKey[] = await response.json();
+    for (const { id, key, value } of keys) {
+      entries[key] = value;
+      lastId = id;
+    }
+    if (keys.length < BIGMAP_PAGE_SIZE) {
+      return entries;
+    }
+  }
+}
+
 export async function loadGovernanceContractTzkt(governanceAddress: string) {
   try {
-    const response = await fetch(`https://api.mainnet.tzkt.io/v1/contracts/${governanceAddress}/storage`);
+    const response = await fetch(`${SELECTED_TZKT_API_URL}/v1/contracts/${governanceAddress}/storage`);
     const data = await response.json();
     governanceStorageData.admin = data.admin;
-    governanceStorageData.deployedContracts = data.deployedContracts;
+    governanceStorageData.deployedContracts = await resolveDeployedContracts(data.deployedContracts);
     return data;
   } catch (error) {
     console.error("Failed to load governance contract storage:", error);
     throw error;
   }
-} 
\ No newline at end of file
+}
@@ -0,0 +1,43 @@
+import { json } from '@sveltejs/kit';
+import { TezosToolkit } from '@taquito/taquito';
+import type { RequestHandler } from './$types';
+import { SELECTED_RPC_URL } from '$lib/config/networkConfig';
+
+const tezos = new TezosToolkit(SELECTED_RPC_URL);
+
+export const GET: RequestHandler = async ({ params, url }) => {
+    const { address, view } = params;
+    const input = url.searchParams.get('input');
+
+    if (!address || !view) {
+        return json({ error: 'Contract address and view name are required' }, { status: 400 });
+    }
+
+    try {
+        // On-chain views are executed by the node (run_script_view), so only
+        // the view result is transferred instead of the whole storage
+        const contract = await tezos.contract.at(address);
+        const contractView = contract.contractViews[view];
+
+        if (!contractView) {
+            return json({ error: `Unknown view: ${view}`, address }, { status: 404 });
+        }
+
+        const result = await contractView(input ? JSON.parse(input) : undefined).executeView({ viewCaller: address });
+
+        return json({
+            address,
+            view,
+            result,
+            success: true
+        });
+
+    } catch (error) {
+        console.error('Contract view error:', error);
+        return json({
+            error: 'Failed to execute contract view',
+            address,
+            view
+        }, { status: 500 });
+    }
+};